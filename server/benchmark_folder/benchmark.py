@@ -0,0 +1,206 @@
+"""
+Microbenchmarks of the encode, decode and upload shaping paths.
+
+Run from the server folder:
+    python -m benchmark_folder.benchmark
+    python -m benchmark_folder.benchmark --fields 10,1000,50000 --ratios 0.01,0.5 --output result.json
+
+Every result is the time of one call in seconds, the best and the median of
+the repeats are reported as json.
+"""
+from argparse import ArgumentParser
+from random import Random
+from statistics import median
+from timeit import Timer
+from json import dumps
+from itertools import cycle
+from snap7.util import set_bool, set_int, set_real, set_string
+from plc_folder.plc_util import create_bytearray
+from plc_folder.plc_models import Datablock, Version_Model
+from plc_folder import plc_numpy
+from fb_folder.fb_module import Firebase
+import platform
+
+DEFAULT_FIELDS = (10, 100, 1000, 10000, 50000)
+DEFAULT_RATIOS = (0.01, 0.1, 1.0)
+DEFAULT_REPEAT = 5
+DEFAULT_DATABLOCKS = 4
+# weights of Bool, Int, Real and String fields in a synthetic template
+TYPE_WEIGHTS = (('Bool', 30), ('Int', 30), ('Real', 35), ('String', 5))
+STRING_BYTES = 258
+
+
+def make_template(fields, seed=0):
+    """
+    create a synthetic template with mixed data types
+    :param fields: int
+    :param seed: int
+    :return tuple (list contains dicts, int size)
+    """
+    rng = Random(seed)
+    types = [foo for foo, _ in TYPE_WEIGHTS]
+    weights = [bar for _, bar in TYPE_WEIGHTS]
+    template = []
+    byte = 0
+    bit = 8
+
+    for _ in range(fields):
+        data_type = rng.choices(types, weights)[0]
+
+        if data_type == 'Bool':
+            if bit == 8:
+                bool_byte, bit = byte, 0
+                byte += 1
+            template.append({'Data_type': 'Bool', 'Offset': float('{}.{}'.format(bool_byte, bit)),
+                             'Value': rng.random() < 0.5})
+            bit += 1
+            continue
+
+        if byte % 2:
+            # Int, Real and String start at even bytes on a plc
+            byte += 1
+
+        if data_type == 'Int':
+            template.append({'Data_type': 'Int', 'Offset': byte, 'Value': rng.randint(-32768, 32767)})
+            byte += 2
+        elif data_type == 'Real':
+            template.append({'Data_type': 'Real', 'Offset': byte, 'Value': rng.uniform(-1000, 1000)})
+            byte += 4
+        else:
+            template.append({'Data_type': 'String', 'Offset': byte, 'Value': 'value {}'.format(rng.random())})
+            byte += STRING_BYTES
+
+    return template, byte + byte % 2
+
+
+def mutate(image, template, ratio, seed=0):
+    """
+    return a copy of image in which ratio of the fields have new values
+    :param image: bytes or bytearray
+    :param template: list contains dicts
+    :param ratio: float, 0 to 1
+    :param seed: int
+    :return: bytearray
+    """
+    rng = Random(seed)
+    holder = bytearray(image)
+    count = min(len(template), max(1, int(round(len(template) * ratio))))
+
+    for foo in rng.sample(template, count):
+        offset = foo['Offset']
+        if foo['Data_type'] == 'Bool':
+            byte, bit = str(float(offset)).split('.')
+            set_bool(holder, int(byte), int(bit), not foo['Value'])
+        elif foo['Data_type'] == 'Int':
+            set_int(holder, offset, (foo['Value'] + 32769) % 65536 - 32768)
+        elif foo['Data_type'] == 'Real':
+            set_real(holder, offset, foo['Value'] + 1.5)
+        else:
+            set_string(holder, offset, 'changed {}'.format(rng.random()), 256)
+
+    return holder
+
+
+def make_datablocks(fields, count):
+    """
+    create the datablocks node of a plc whose fields are shared by count datablocks
+    :return dict
+    """
+    count = max(1, min(count, fields))
+    datablocks = {'data_block_names': []}
+
+    for number in range(1, count + 1):
+        template, size = make_template(fields // count + (number <= fields % count), seed=number)
+        name = 'DB{}'.format(number)
+        datablocks['data_block_names'].append(name)
+        datablocks[name] = {'size': size, 'data': template}
+
+    return datablocks
+
+
+def measure(function, repeat):
+    """
+    time one call of function
+    :return tuple (best, median, calls) in seconds per call
+    """
+    timer = Timer(function)
+    number, _ = timer.autorange()
+    times = [foo / number for foo in timer.repeat(repeat=repeat, number=number)]
+    return min(times), median(times), number
+
+
+def bench_fields(fields, ratios, repeat, datablocks):
+    """
+    run every benchmark for a template size
+    :return list contains dicts
+    """
+    template, size = make_template(fields)
+    image = bytes(create_bytearray(size=size, lst=template))
+    results = []
+
+    def record(case, function, ratio=None):
+        best, middle, calls = measure(function, repeat)
+        results.append({'case': case, 'fields': fields, 'size': size, 'ratio': ratio,
+                        'best': best, 'median': middle, 'calls': calls,
+                        'best_per_field_ns': best / fields * 1e9})
+
+    record('create_bytearray', lambda: create_bytearray(size=size, lst=template))
+    record('datablock_init', lambda: Datablock(_name='DB1', size=size, data=template))
+
+    node = {'plc_informations': {}, 'datablocks': make_datablocks(fields, datablocks)}
+    record('version_model', lambda: Version_Model(_name='current', **node))
+
+    for ratio in ratios:
+        changed = mutate(image, template, ratio)
+        images = cycle([bytearray(changed), bytearray(image)])
+        datablock = Datablock(_name='DB1', size=size, data=template)
+        # every call compares the image with the previous one, so each call sees ratio of the fields changed
+        record('create_data_for_fb', lambda: datablock.create_data_for_fb(next(images)), ratio)
+
+        lst = ['plc_uid', Datablock(_name='DB1', size=size, data=template).create_data_for_fb(bytearray(changed))]
+        record('plc_data_payload', lambda: Firebase.plc_data_payload(lst), ratio)
+
+    return results
+
+
+def run(fields=DEFAULT_FIELDS, ratios=DEFAULT_RATIOS, repeat=DEFAULT_REPEAT, datablocks=DEFAULT_DATABLOCKS):
+    """
+    run the suite
+    :return dict, json serializable
+    """
+    results = []
+    for foo in fields:
+        results.extend(bench_fields(foo, ratios, repeat, datablocks))
+
+    return {'python': platform.python_version(), 'implementation': platform.python_implementation(),
+            'machine': platform.machine(), 'numpy': plc_numpy.available(), 'repeat': repeat, 'results': results}
+
+
+def _numbers(text, kind):
+    return tuple(kind(foo) for foo in text.split(',') if foo)
+
+
+def main(argv=None):
+    parser = ArgumentParser(description="benchmarks of the plc encode, decode and upload paths")
+    parser.add_argument('--fields', default=','.join(map(str, DEFAULT_FIELDS)),
+                        help="comma separated template sizes")
+    parser.add_argument('--ratios', default=','.join(map(str, DEFAULT_RATIOS)),
+                        help="comma separated ratios of changed fields")
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT)
+    parser.add_argument('--datablocks', type=int, default=DEFAULT_DATABLOCKS,
+                        help="datablocks which the version model benchmark splits a template into")
+    parser.add_argument('--output', default=None, help="json file, stdout if it is not given")
+    args = parser.parse_args(argv)
+
+    report = run(_numbers(args.fields, int), _numbers(args.ratios, float), args.repeat, args.datablocks)
+    text = dumps(report, indent=2)
+
+    if args.output is None:
+        print(text)
+    else:
+        with open(args.output, 'w') as output:
+            output.write(text)
+
+
+if __name__ == '__main__':
+    main()
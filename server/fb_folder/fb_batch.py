@@ -0,0 +1,177 @@
+from threading import Condition, Lock, Thread
+from time import monotonic
+import logging
+
+DEFAULT_WINDOW = 0.2
+DEFAULT_MAX_SIZE = 1000
+
+
+def parents(path):
+    """
+    return every ancestor of a path
+    :param path: str
+    :return list contains str
+    """
+    parts = path.strip('/').split('/')
+    return ['/'.join(parts[:index]) for index in range(1, len(parts))]
+
+
+def merge(payloads, max_size=DEFAULT_MAX_SIZE):
+    """
+    merge multi-location maps in order until max_size paths or until a map has
+    a path whose ancestor or descendant is already merged, firebase refuses such an update
+    :param payloads: list contains dicts {path: value}
+    :param max_size: int
+    :return tuple (dict, int), the merged map and how many maps it contains
+    """
+    merged = {}
+    ancestors = set()
+    used = 0
+
+    for payload in payloads:
+        if used and (len(merged) + len(payload) > max_size or
+                     any(path in ancestors or any(foo in merged for foo in parents(path)) for path in payload)):
+            break
+
+        for path, value in payload.items():
+            merged[path] = value
+            ancestors.update(parents(path))
+        used += 1
+
+    return merged, used
+
+
+class UploadBatcher:
+    """
+    Collects path/value maps of many plcs and sends them as one multi-location update.
+    A batch is sent when it has max_size paths or when it is window seconds old.
+    """
+
+    def __init__(self, sink, window=DEFAULT_WINDOW, max_size=DEFAULT_MAX_SIZE):
+        """
+        UploadBatcher constructor
+        :param sink: function which takes a dict, for example Firebase.update
+        :param window: float, seconds
+        :param max_size: int, paths
+        :raise ValueError
+        """
+        if window < 0 or max_size < 1:
+            raise ValueError("window and max_size must be positive")
+
+        self.__sink = sink
+        self.__window = window
+        self.__max_size = max_size
+        self.__pending = {}
+        self.__ancestors = set()
+        self.__deadline = None
+        self.__condition = Condition()
+        self.__sink_lock = Lock()
+        self.__active = True
+        self.__thread = Thread(target=self.__run, name="upload-batcher", daemon=True)
+        self.__thread.start()
+
+    def add(self, payload):
+        """
+        add a multi-location map to the batch
+        :param payload: dict {path: value}
+        :return:
+        """
+        if not payload:
+            return
+
+        if self.__conflicts(payload):
+            # firebase refuses an update which has a path and its ancestor, so the older batch goes first
+            self.flush()
+
+        with self.__condition:
+            for path, value in payload.items():
+                self.__pending[path] = value
+                self.__ancestors.update(parents(path))
+
+            if self.__deadline is None:
+                self.__deadline = monotonic() + self.__window
+                self.__condition.notify()
+            full = len(self.__pending) >= self.__max_size
+
+        if full:
+            self.flush()
+
+    def flush(self):
+        """
+        send the batch now
+        :return:
+        """
+        with self.__sink_lock:
+            with self.__condition:
+                batch = self.__take()
+
+            if batch:
+                self.__sink(batch)
+
+    def close(self):
+        """
+        send the batch and stop the timer thread
+        :return:
+        """
+        with self.__condition:
+            self.__active = False
+            self.__condition.notify()
+
+        self.__thread.join()
+        self.flush()
+
+    def __conflicts(self, payload):
+        """
+        whether a path of payload is an ancestor or a descendant of a pending path
+        :return Boolean
+        """
+        with self.__condition:
+            for path in payload:
+                if path in self.__ancestors:
+                    return True
+                if any(foo in self.__pending for foo in parents(path)):
+                    return True
+
+        return False
+
+    def __take(self):
+        """
+        take the pending batch, the condition must be held
+        :return dict
+        """
+        batch = self.__pending
+        self.__pending = {}
+        self.__ancestors = set()
+        self.__deadline = None
+        return batch
+
+    def __run(self):
+        """
+        send a batch when its window is over
+        :return:
+        """
+        while True:
+            with self.__condition:
+                if not self.__active:
+                    return
+                if self.__deadline is None:
+                    self.__condition.wait()
+                    continue
+                delay = self.__deadline - monotonic()
+                if delay > 0:
+                    self.__condition.wait(delay)
+                    continue
+
+            try:
+                self.flush()
+            except Exception:
+                logging.exception("batched upload failed")
+
+    @property
+    def depth(self):
+        """
+        return how many paths are waiting
+        :return: int
+        """
+        with self.__condition:
+            return len(self.__pending)
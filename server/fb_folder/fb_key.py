@@ -0,0 +1,97 @@
+from hashlib import sha256
+from json import load, loads, dump
+from threading import Lock
+from fb_folder import fb_exception
+import os
+
+KEY_CHECK_TIMEOUT = 5.0
+KEY_CACHE_PATH = ".key_check_cache.json"
+KEY_FIELDS = ('type', 'project_id', 'private_key_id', 'private_key', 'client_email', 'client_id',
+              'auth_uri', 'token_uri', 'auth_provider_x509_cert_url', 'client_x509_cert_url')
+
+_lock = Lock()
+
+
+def check_key(key_path, timeout=KEY_CHECK_TIMEOUT, cache_path=KEY_CACHE_PATH):
+    """
+    check whether the key is correct and return the database link of its project.
+    A key whose certificate url was found once is not checked online again, the
+    cache is keyed by the sha256 of the key file so a changed key is checked again.
+    It does not import firebase_admin, so it can run while the heavy modules are imported.
+    :param key_path: str
+    :param timeout: float, seconds of the certificate request
+    :param cache_path: str or None, None does not use the cache file
+    :return: str
+    :raises
+        fb_exception.SecurityKeyError
+        TypeError
+        ValueError
+        KeyError
+    """
+    if not isinstance(key_path, str):
+        raise TypeError("key_path parameter must be argument.")
+
+    if not key_path.endswith('.json'):
+        raise ValueError("key_path must be json file.")
+
+    with open(key_path, 'rb') as key:
+        content = key.read()
+
+    key_dict = loads(content)
+    for foo in KEY_FIELDS:
+        if foo not in key_dict:
+            raise KeyError('firebase security key is not correct.')
+
+    link_for_checking = key_dict['client_x509_cert_url']
+    index = link_for_checking.find("%40") + 3
+    index2 = link_for_checking.rfind(".iam")
+    db_link = "https://{}.firebaseio.com/".format(link_for_checking[index: index2])
+
+    digest = sha256(content).hexdigest()
+    with _lock:
+        if digest in _read_cache(cache_path):
+            return db_link
+
+    from requests import get
+    from requests.exceptions import RequestException
+
+    try:
+        exists = get(link_for_checking, timeout=timeout).ok
+    except RequestException as Error:
+        raise fb_exception.SecurityKeyError("Firebase project could not be checked: {}".format(Error))
+
+    if not exists:
+        raise fb_exception.SecurityKeyError("Firebase project does not exist.")
+
+    with _lock:
+        cache = _read_cache(cache_path)
+        cache[digest] = db_link
+        _write_cache(cache_path, cache)
+
+    return db_link
+
+
+def _read_cache(cache_path):
+    if cache_path is None:
+        return {}
+
+    try:
+        with open(cache_path, 'r') as cache:
+            holder = load(cache)
+    except (OSError, ValueError):
+        return {}
+
+    return holder if isinstance(holder, dict) else {}
+
+
+def _write_cache(cache_path, cache):
+    if cache_path is None:
+        return
+
+    try:
+        temporary = cache_path + '.tmp'
+        with open(temporary, 'w') as output:
+            dump(cache, output)
+        os.replace(temporary, cache_path)
+    except OSError:
+        pass
@@ -0,0 +1,122 @@
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+
+DEFAULT_TTL = 60.0
+DEFAULT_MAX_SIZE = 100000
+VALUES_PER_PATH = 4
+
+
+class WriteLedger:
+    """
+    Paths and values which the server wrote recently. A listener event whose
+    values are all in the ledger is an echo of the server's own write. An echo
+    consumes its write, so every write of the server suppresses exactly one event.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL, max_size=DEFAULT_MAX_SIZE):
+        """
+        WriteLedger constructor
+        :param ttl: float, seconds which a write is remembered
+        :param max_size: int, paths which are remembered at most
+        """
+        self.__ttl = ttl
+        self.__max_size = max_size
+        self.__entries = OrderedDict()
+        self.__lock = Lock()
+
+    def record(self, payload):
+        """
+        record a multi-location map before it is sent
+        :param payload: dict {path: value}
+        :return:
+        """
+        now = monotonic()
+
+        with self.__lock:
+            for path, value in payload.items():
+                path = path.strip('/')
+                values = self.__entries.pop(path, [])
+                values.append((value, now))
+                # a path can be written again before the echo of its older value arrives
+                self.__entries[path] = values[-VALUES_PER_PATH:]
+
+            self.__expire(now)
+
+    def changer_id(self, path, data, patch):
+        """
+        decide the changer of an event without asking the database
+        :param path: str, event.path
+        :param data: event.data
+        :param patch: boolean, whether the event is a patch
+        :return: str or None, None means the ledger cannot decide
+        """
+        base = path.strip('/')
+
+        if not patch:
+            return 'server' if self.__consume([(base, data)]) else None
+
+        if not isinstance(data, dict) or not data:
+            return None
+
+        items = [('/'.join(foo for foo in (base, key.strip('/')) if foo), value) for key, value in data.items()]
+
+        for key, value in items:
+            # a patch which sets plc_uid/changer_id carries its changer itself
+            parts = key.split('/')
+            if len(parts) == 2 and parts[1] == 'changer_id':
+                if value == 'server':
+                    # the echo still consumes its writes, an operator can set these values again
+                    self.__consume(items, partial=True)
+                return value
+
+        if self.__consume(items):
+            return 'server'
+
+        return None
+
+    def __consume(self, items, partial=False):
+        """
+        whether every value was written to its path recently, then the writes are consumed.
+        The events arrive in order, so the oldest matching write is the one which echoes and
+        the writes before it are consumed too, their echoes are gone.
+        :param items: list contains tuples (path, value)
+        :param partial: boolean, the matching writes are consumed even if some values do not match
+        :return Boolean
+        """
+        now = monotonic()
+
+        with self.__lock:
+            found = []
+            for path, value in items:
+                values = self.__entries.get(path, ())
+                for index, (foo, written) in enumerate(values):
+                    if foo == value and now - written <= self.__ttl:
+                        found.append((path, index))
+                        break
+                else:
+                    if not partial:
+                        return False
+
+            for path, index in found:
+                values = self.__entries[path][index + 1:]
+                if values:
+                    self.__entries[path] = values
+                else:
+                    del self.__entries[path]
+
+        return len(found) == len(items)
+
+    def __expire(self, now):
+        """
+        forget old and excess paths, the lock must be held
+        :return:
+        """
+        while self.__entries:
+            path, values = next(iter(self.__entries.items()))
+            if len(self.__entries) <= self.__max_size and now - values[-1][1] <= self.__ttl:
+                break
+            del self.__entries[path]
+
+    def __len__(self):
+        return len(self.__entries)
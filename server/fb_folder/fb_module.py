@@ -1,21 +1,25 @@
 import firebase_admin as fb
 from firebase_admin import db
-from json import load
-from requests import get
 from fb_folder import fb_exception
+from fb_folder.fb_key import check_key
+from fb_folder.fb_ledger import WriteLedger
 import logging
 
 
 class Firebase(db.Reference):
     """Firebase object"""
 
-    def __init__(self, key_path, options=None):
-        """a main contructor of firebase objects"""
+    def __init__(self, key_path, options=None, db_link=None):
+        """
+        a main contructor of firebase objects
+        :param db_link: str or None, the link which fb_key.check_key returned already, the key is not checked again
+        """
 
         self.__default_app = None
         self.__listen_object = None
+        self.__ledger = WriteLedger()
 
-        self.__connect_fb(key_path, options=options)
+        self.__connect_fb(key_path, options=options, db_link=db_link)
 
         client = self.__my_reference(self.__default_app)
 
@@ -28,10 +32,11 @@ class Firebase(db.Reference):
         return client
 
     @staticmethod
-    def __key_checker(key_path):
+    def __key_checker(key_path, db_link=None):
         """
         check whether the key is correct or not
         :param key_path:
+        :param db_link: str or None, a link which is checked already
         :return tuple
         :raises
             fb_exception.SecurityKeyError
@@ -39,45 +44,24 @@ class Firebase(db.Reference):
             ValueError
             KeyError
         """
-
-        if not isinstance(key_path, str):
-            raise TypeError("key_path parameter must be argument.")
-
-        if not key_path.endswith('.json'):
-            raise ValueError("key_path must be json file.")
-
-        with open(key_path, 'r') as key:
-            key_dict = load(key)
-
-        for foo in ['type', 'project_id', 'private_key_id', 'private_key', 'client_email', 'client_id',
-                    'auth_uri', 'token_uri', 'auth_provider_x509_cert_url', 'client_x509_cert_url']:
-            if foo not in key_dict:
-                raise KeyError('firebase security key is not correct.')
-
-        link_for_checking = key_dict['client_x509_cert_url']
-
-        if not get(link_for_checking).ok:
-            raise fb_exception.SecurityKeyError("Firebase project does not exist.")
-
-        index = link_for_checking.find("%40") + 3
-        index2 = link_for_checking.rfind(".iam")
-
-        db_link = "https://{}.firebaseio.com/".format(link_for_checking[index: index2])
+        if db_link is None:
+            db_link = check_key(key_path)
         cred = fb.credentials.Certificate(key_path)
 
         return db_link, cred
 
-    def __connect_fb(self, key_path, options=None):
+    def __connect_fb(self, key_path, options=None, db_link=None):
         """
         Connect to the firebase
         :param key_path:
+        :param db_link: str or None, a link which is checked already
         :return:
         :raises
             TypeError
             KeyError
         """
 
-        db_link, cred = self.__key_checker(key_path)
+        db_link, cred = self.__key_checker(key_path, db_link)
 
         if not options:
             self.__default_app = fb.initialize_app(cred, {'databaseURL': db_link})
@@ -121,7 +105,7 @@ class Firebase(db.Reference):
                     plc_uid = event.path.split('/')[1]
 
                     if not isinstance(event.data, dict):
-                        changer_id = self.child(plc_uid).child("changer_id").get()
+                        changer_id = self.__changer_id(plc_uid, event, patch=False)
                     else:
                         try:
                             changer_id = event.data['changer_id']
@@ -137,7 +121,7 @@ class Firebase(db.Reference):
                     # if event.path is not '/', the data was changed via single-location method
                     plc_uid = event.path.split('/')[1]
 
-                changer_id = self.child(plc_uid).child("changer_id").get()
+                changer_id = self.__changer_id(plc_uid, event, patch=True)
 
             if changer_id == "server":
                 my_server = True
@@ -158,6 +142,20 @@ class Firebase(db.Reference):
 
         self.__listen_object = self.listen(__listen_function)
 
+    def __changer_id(self, plc_uid, event, patch):
+        """
+        find who changed the data, the database is asked only when the write ledger cannot decide
+        :param plc_uid: str
+        :param event:
+        :param patch: boolean
+        :return: str or None
+        """
+        changer_id = self.__ledger.changer_id(event.path, event.data, patch)
+        if changer_id is None:
+            changer_id = self.child(plc_uid).child("changer_id").get()
+
+        return changer_id
+
     def close_listen(self):
         """
         Close to listen to the database
@@ -185,6 +183,26 @@ class Firebase(db.Reference):
         if lst is None:
             return
 
+        self.send_update(self.plc_data_payload(lst))
+
+    def send_update(self, payload):
+        """
+        record a multi-location map in the write ledger and send it
+        :param payload: dict {path: value}
+        :return:
+        """
+        # the echo can arrive before update returns, so the ledger is written first
+        self.__ledger.record(payload)
+        self.update(payload)
+
+    @staticmethod
+    def plc_data_payload(lst):
+        """
+        create the multi-location map of plc data, update_plc_data sends it
+        :param lst: a list contains tuple which a format is (path, value) and lst[0]=plc_uid
+        :return: dict
+        :raise TypeError
+        """
         if not isinstance(lst, list):
             raise TypeError("lst must be list")
         "lst = [plc_uid, blabla"
@@ -199,28 +217,22 @@ class Firebase(db.Reference):
 
         _data[plc_uid + '/permission/to_write'] = True
         _data[plc_uid + '/changer_id'] = 'server'
-        self.update(_data)
+        return _data
 
-    def change_new(self, plc_uid):
+    @staticmethod
+    def new_payload(plc_uid, new):
         """
-        change new to current
-        :param plc_uid
-        :return:
-        :raises
-            TypeError
+        return the multi-location map which changes new to current
+        :param plc_uid: str
+        :param new: dict, the new node of the plc
+        :return: dict
         """
-
-        if not isinstance(plc_uid, str):
-            raise TypeError("plc_uid must be string")
-
-        child_node = self.child(plc_uid + "/new")
-        data_ = child_node.get()
-        self.update({
+        return {
             plc_uid + "/new": None,
-            plc_uid + "/current": data_,
+            plc_uid + "/current": new,
             plc_uid + "/permission/to_write": True,
             plc_uid + '/changer_id': 'server'
-        })
+        }
 
     def delete_plc(self, plc_uid):
         """
@@ -0,0 +1,393 @@
+from collections import deque
+from threading import Condition, Thread
+from random import uniform
+from json import dumps, loads
+from fb_folder.fb_batch import merge
+import logging
+import os
+
+DEFAULT_JOURNAL = "upload_journal.jsonl"
+DEFAULT_MAX_ITEMS = 1000
+DEFAULT_MAX_BATCH = 1000
+RETRY_MIN = 0.5
+RETRY_MAX = 30.0
+DEAD_LETTER_SUFFIX = ".dead"
+# bytes which are read at once while the end of the journal is searched
+TAIL_CHUNK = 65536
+# 4xx statuses which can pass when they are tried again
+TRANSIENT_STATUSES = (401, 408, 429)
+
+
+def is_permanent(error):
+    """
+    whether the database will never accept the map which raised the error, for example
+    a 400 of an invalid key or a NaN Real. Network errors and 5xx are transient.
+    :param error: Exception
+    :return: Boolean
+    """
+    if isinstance(error, (ValueError, TypeError)):
+        return True
+
+    # firebase_admin.exceptions.FirebaseError and requests.HTTPError carry the response
+    response = getattr(error, 'http_response', None) or getattr(error, 'response', None)
+    status = getattr(response, 'status_code', None)
+    return isinstance(status, int) and 400 <= status < 500 and status not in TRANSIENT_STATUSES
+
+
+class WriteBehindQueue:
+    """
+    Sends multi-location maps to the database from a background thread.
+    Maps wait in memory up to max_items. When sending fails or memory is full
+    they are appended to a journal file, and the journal is replayed in order
+    with exponential backoff until the database is reachable again. A journal
+    which is left by an earlier run is replayed first. A map which the database
+    rejects for good, or a journal line which a crash tore, is moved to the dead-letter
+    file, so it does not block the others.
+    """
+
+    def __init__(self, sink, journal_path=DEFAULT_JOURNAL, max_items=DEFAULT_MAX_ITEMS,
+                 max_batch=DEFAULT_MAX_BATCH):
+        """
+        WriteBehindQueue constructor
+        :param sink: function which takes a dict and raises when it is not sent, for example Firebase.send_update
+        :param journal_path: str
+        :param max_items: int, maps which wait in memory at most
+        :param max_batch: int, paths which are sent at once at most
+        :raise ValueError
+        """
+        if max_items < 1 or max_batch < 1:
+            raise ValueError("max_items and max_batch must be positive")
+
+        self.__sink = sink
+        self.__journal_path = journal_path
+        self.__offset_path = journal_path + ".offset"
+        self.__dead_path = journal_path + DEAD_LETTER_SUFFIX
+        self.__rejected = 0
+        self.__max_items = max_items
+        self.__max_batch = max_batch
+        self.__memory = deque()
+        self.__condition = Condition()
+        self.__offset = self.__read_offset()
+        self.__repair()
+        self.__spilling = self.__journal_size() > self.__offset
+        self.__retry = 0.0
+        self.__active = True
+        self.__thread = Thread(target=self.__run, name="write-behind", daemon=True)
+        self.__thread.start()
+
+    def put(self, payload):
+        """
+        queue a multi-location map, it never blocks on the network
+        :param payload: dict {path: value}
+        :return:
+        """
+        if not payload:
+            return
+
+        with self.__condition:
+            if self.__spilling or len(self.__memory) >= self.__max_items:
+                # once the journal is used every newer map goes there too, so the order is kept
+                self.__append(list(self.__memory) + [payload])
+                self.__memory.clear()
+                self.__spilling = True
+            else:
+                self.__memory.append(payload)
+            self.__condition.notify()
+
+    def close(self, timeout=5.0):
+        """
+        try to send what is waiting, the rest is kept in the journal for the next run
+        :param timeout: float, seconds
+        :return:
+        """
+        with self.__condition:
+            self.__active = False
+            self.__condition.notify()
+
+        self.__thread.join(timeout)
+
+        with self.__condition:
+            if self.__memory:
+                self.__append(list(self.__memory))
+                self.__memory.clear()
+                self.__spilling = True
+
+    def __run(self):
+        """
+        send maps from memory or replay the journal, an unexpected error backs off and does not end the thread
+        :return:
+        """
+        while True:
+            try:
+                if not self.__step():
+                    return
+            except Exception:
+                logging.exception("write-behind of {} failed".format(self.__journal_path))
+                with self.__condition:
+                    self.__back_off()
+
+    def __step(self):
+        """
+        wait for maps and send them once
+        :return: Boolean, False when the queue is closed
+        """
+        with self.__condition:
+            while self.__active and not self.__memory and not self.__spilling:
+                self.__condition.wait()
+
+            if self.__retry:
+                # backing off, close ends the wait
+                if not self.__active:
+                    return False
+                self.__condition.wait(uniform(0.5, 1.0) * self.__retry)
+                if not self.__active:
+                    return False
+
+            if self.__spilling:
+                batch = None
+            elif self.__memory:
+                batch, used = merge(list(self.__memory), self.__max_batch)
+                payloads = [self.__memory.popleft() for _ in range(used)]
+            else:
+                return False
+
+        if batch is None:
+            self.__replay()
+        else:
+            self.__send(batch, payloads)
+        return True
+
+    def __deliver(self, batch, payloads):
+        """
+        send the merged maps. When the database rejects the batch for good, its maps are
+        sent one by one and the rejected ones are moved to the dead-letter file.
+        :param batch: dict, the merge of payloads
+        :param payloads: list contains dict
+        :return tuple (error, unsent), the transient error and the maps which are not sent, or (None, [])
+        """
+        try:
+            self.__sink(batch)
+            return None, []
+        except Exception as Error:
+            if not is_permanent(Error):
+                return Error, payloads
+            rejected = Error
+
+        if len(payloads) == 1:
+            self.__dead_letter(payloads[0], rejected)
+            return None, []
+
+        for index, foo in enumerate(payloads):
+            try:
+                self.__sink(foo)
+            except Exception as Error:
+                if not is_permanent(Error):
+                    return Error, payloads[index:]
+                self.__dead_letter(foo, Error)
+
+        return None, []
+
+    def __dead_letter(self, payload, error):
+        """
+        keep a rejected map in the dead-letter file
+        :return:
+        """
+        logging.error("upload is rejected and moved to {}: {}".format(self.__dead_path, error))
+        self.__rejected += 1
+
+        with open(self.__dead_path, 'a') as dead:
+            dead.write(dumps({'error': str(error), 'payload': payload}) + '\n')
+
+    def __send(self, batch, payloads):
+        """
+        send a batch from memory, its unsent maps are put in the journal if sending fails
+        :return:
+        """
+        error, unsent = self.__deliver(batch, payloads)
+        if error is None:
+            self.__retry = 0.0
+            return
+
+        logging.warning("upload failed, changes are kept in {}: {}".format(self.__journal_path, error))
+        with self.__condition:
+            # the journal can have newer maps already, the batch must stay before them
+            self.__prepend(unsent)
+            self.__append(list(self.__memory))
+            self.__memory.clear()
+            self.__spilling = True
+            self.__back_off()
+
+    def __replay(self):
+        """
+        send the next maps of the journal, the journal is emptied when all of it is sent
+        :return:
+        """
+        payloads = []
+        ends = []
+
+        with open(self.__journal_path, 'rb') as journal:
+            journal.seek(self.__offset)
+            while len(payloads) < self.__max_items:
+                line = journal.readline()
+                if not line.endswith(b'\n'):
+                    # a map which is being appended
+                    break
+                try:
+                    payload = loads(line)
+                except ValueError as Error:
+                    if payloads:
+                        # the maps before it are sent first, it is skipped in the next replay
+                        break
+                    self.__dead_letter(line.decode('utf-8', 'replace').rstrip('\n'), Error)
+                    self.__offset = journal.tell()
+                    self.__write_offset()
+                    continue
+                payloads.append(payload)
+                ends.append(journal.tell())
+
+        if payloads:
+            batch, used = merge(payloads, self.__max_batch)
+            error, unsent = self.__deliver(batch, payloads[:used])
+            done = used - len(unsent)
+
+            if done:
+                self.__offset = ends[done - 1]
+                self.__write_offset()
+
+            if error is not None:
+                logging.warning("replay of {} failed: {}".format(self.__journal_path, error))
+                with self.__condition:
+                    self.__back_off()
+                return
+
+            self.__retry = 0.0
+
+        with self.__condition:
+            if self.__offset >= self.__journal_size():
+                open(self.__journal_path, 'w').close()
+                self.__offset = 0
+                self.__write_offset()
+                self.__spilling = False
+                logging.warning("{} is replayed".format(self.__journal_path))
+
+    def __back_off(self):
+        """
+        double the retry delay, the condition must be held
+        :return:
+        """
+        self.__retry = min(RETRY_MAX, max(RETRY_MIN, self.__retry * 2))
+
+    def __append(self, payloads):
+        """
+        append maps to the journal, the condition must be held
+        :return:
+        """
+        if not payloads:
+            return
+
+        with open(self.__journal_path, 'a') as journal:
+            for foo in payloads:
+                journal.write(dumps(foo) + '\n')
+            journal.flush()
+            os.fsync(journal.fileno())
+
+    def __prepend(self, payloads):
+        """
+        put maps before the maps which are not replayed yet, the condition must be held
+        :return:
+        """
+        if self.__journal_size() <= self.__offset:
+            self.__append(payloads)
+            return
+
+        temporary = self.__journal_path + ".tmp"
+        with open(temporary, 'wb') as journal:
+            for foo in payloads:
+                journal.write((dumps(foo) + '\n').encode())
+            with open(self.__journal_path, 'rb') as old:
+                old.seek(self.__offset)
+                journal.write(old.read())
+            journal.flush()
+            os.fsync(journal.fileno())
+
+        os.replace(temporary, self.__journal_path)
+        self.__offset = 0
+        self.__write_offset()
+
+    def __repair(self):
+        """
+        cut a map which a crash tore at the end of the journal, so a later append does not
+        join it. The torn bytes are moved to the dead-letter file.
+        :return:
+        """
+        size = self.__journal_size()
+        if not size:
+            return
+
+        with open(self.__journal_path, 'rb+') as journal:
+            journal.seek(size - 1)
+            if journal.read(1) == b'\n':
+                return
+
+            start = size
+            while start > 0:
+                step = min(start, TAIL_CHUNK)
+                journal.seek(start - step)
+                found = journal.read(step).rfind(b'\n')
+                start -= step
+                if found >= 0:
+                    start += found + 1
+                    break
+
+            journal.seek(start)
+            torn = journal.read()
+            journal.truncate(start)
+            journal.flush()
+            os.fsync(journal.fileno())
+
+        self.__dead_letter(torn.decode('utf-8', 'replace'), "torn journal line")
+        if self.__offset > start:
+            self.__offset = start
+            self.__write_offset()
+
+    def __journal_size(self):
+        try:
+            return os.path.getsize(self.__journal_path)
+        except OSError:
+            return 0
+
+    def __read_offset(self):
+        try:
+            with open(self.__offset_path, 'r') as offset:
+                return int(offset.read() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def __write_offset(self):
+        with open(self.__offset_path, 'w') as offset:
+            offset.write(str(self.__offset))
+
+    @property
+    def depth(self):
+        """
+        return how many maps wait in memory
+        :return: int
+        """
+        with self.__condition:
+            return len(self.__memory)
+
+    @property
+    def rejected(self):
+        """
+        return how many maps were moved to the dead-letter file
+        :return: int
+        """
+        return self.__rejected
+
+    @property
+    def spilling(self):
+        """
+        return whether maps wait in the journal
+        :return: Boolean
+        """
+        return self.__spilling
@@ -0,0 +1,300 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+from threading import Lock, Thread
+from queue import Queue, Empty
+from copy import deepcopy
+from json import dumps, loads
+from time import perf_counter
+
+KEEP_ALIVE = 5.0
+CERT_PATH = "/robot/v1/metadata/x509/"
+
+
+class FakeDatabase:
+    """
+    In memory tree which behaves like the realtime database for the calls of
+    fb_module.Firebase: get, set, update, delete and listen.
+    """
+
+    def __init__(self, on_write=None):
+        """
+        FakeDatabase constructor
+        :param on_write: function (method, path, data, perf_counter time) or None, called after a write
+        """
+        self.__root = None
+        self.__lock = Lock()
+        self.__listeners = []
+        self.__on_write = on_write
+
+    def get(self, path):
+        """
+        return a copy of the node at path
+        :param path: str
+        :return: json value or None
+        """
+        with self.__lock:
+            node = self.__root
+            for foo in self.__parts(path):
+                node = self.__child(node, foo)
+                if node is None:
+                    return None
+            return deepcopy(node)
+
+    def set(self, path, data):
+        """
+        replace the node at path, None deletes it
+        :return:
+        """
+        with self.__lock:
+            self.__set(self.__parts(path), data)
+            self.__publish('put', path, data)
+
+        self.__written('put', path, data)
+
+    def update(self, path, data):
+        """
+        multi-location update of the children of path
+        :param path: str
+        :param data: dict {relative path: value}
+        :return:
+        """
+        base = self.__parts(path)
+
+        with self.__lock:
+            for key, value in data.items():
+                self.__set(base + self.__parts(key), value)
+            self.__publish('patch', path, data)
+
+        self.__written('patch', path, data)
+
+    def listen(self):
+        """
+        register a listener, its queue gets (event_type, path, data) tuples and starts with the whole tree
+        :return: Queue
+        """
+        events = Queue()
+
+        with self.__lock:
+            events.put(('put', '/', deepcopy(self.__root)))
+            self.__listeners.append(events)
+
+        return events
+
+    def unlisten(self, events):
+        with self.__lock:
+            if events in self.__listeners:
+                self.__listeners.remove(events)
+
+    def __publish(self, event_type, path, data):
+        """
+        send an event to the listeners, the lock must be held
+        :return:
+        """
+        event = (event_type, '/' + '/'.join(self.__parts(path)), deepcopy(data))
+        for foo in self.__listeners:
+            foo.put(event)
+
+    def __written(self, method, path, data):
+        if self.__on_write is not None:
+            self.__on_write(method, path, data, perf_counter())
+
+    @staticmethod
+    def __parts(path):
+        return [foo for foo in path.split('/') if foo]
+
+    @staticmethod
+    def __child(node, key):
+        if isinstance(node, dict):
+            return node.get(key)
+        if isinstance(node, list) and key.isdigit() and int(key) < len(node):
+            return node[int(key)]
+        return None
+
+    def __set(self, parts, value):
+        """
+        set a value in the tree, empty nodes are removed like the realtime database does
+        :return:
+        """
+        if not parts:
+            self.__root = value
+            return
+
+        if not isinstance(self.__root, (dict, list)):
+            self.__root = {}
+
+        node = self.__root
+        trail = []
+        for key in parts[:-1]:
+            child = self.__child(node, key)
+            if not isinstance(child, (dict, list)):
+                if value is None:
+                    return
+                child = {}
+                self.__put(node, key, child)
+            trail.append((node, key))
+            node = child
+
+        if value is None:
+            self.__put(node, parts[-1], None)
+            # a parent without children does not exist on the database
+            while trail and not self.__has_children(node):
+                node, key = trail.pop()
+                self.__put(node, key, None)
+            if not self.__has_children(self.__root):
+                self.__root = None
+        else:
+            self.__put(node, parts[-1], value)
+
+    @staticmethod
+    def __has_children(node):
+        if isinstance(node, dict):
+            return bool(node)
+        return any(foo is not None for foo in node)
+
+    @staticmethod
+    def __put(node, key, value):
+        if isinstance(node, list):
+            index = int(key)
+            node.extend([None] * (index + 1 - len(node)))
+            node[index] = value
+        elif value is None:
+            node.pop(key, None)
+        else:
+            node[key] = value
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """REST and server-sent events interface of the FakeDatabase"""
+
+    protocol_version = 'HTTP/1.1'
+    database = None
+
+    def log_message(self, *args):
+        pass
+
+    def __target(self):
+        url = urlsplit(self.path)
+        path = url.path[:-len('.json')] if url.path.endswith('.json') else url.path
+        return path, parse_qs(url.query)
+
+    def __body(self):
+        size = int(self.headers.get('Content-Length') or 0)
+        return loads(self.rfile.read(size)) if size else None
+
+    def __reply(self, value, query):
+        if query.get('print') == ['silent']:
+            self.send_response(204)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        body = dumps(value).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path, query = self.__target()
+
+        if path.startswith(CERT_PATH):
+            # the key checker only asks whether the certificate url exists
+            self.__reply({}, {})
+        elif 'text/event-stream' in self.headers.get('Accept', ''):
+            self.__stream(path)
+        else:
+            self.__reply(self.database.get(path), query)
+
+    def do_PUT(self):
+        path, query = self.__target()
+        data = self.__body()
+        self.database.set(path, data)
+        self.__reply(data, query)
+
+    def do_PATCH(self):
+        path, query = self.__target()
+        data = self.__body()
+        self.database.update(path, data)
+        self.__reply(data, query)
+
+    def do_DELETE(self):
+        path, query = self.__target()
+        self.database.set(path, None)
+        self.__reply(None, query)
+
+    def __stream(self, path):
+        """
+        send the events under path until the client goes away
+        :return:
+        """
+        base = '/' + '/'.join(foo for foo in path.split('/') if foo)
+        events = self.database.listen()
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self.close_connection = True
+
+        try:
+            while True:
+                try:
+                    event_type, event_path, data = events.get(timeout=KEEP_ALIVE)
+                except Empty:
+                    self.wfile.write(b'event: keep-alive\ndata: null\n\n')
+                    self.wfile.flush()
+                    continue
+
+                if base != '/':
+                    if event_path != base and not event_path.startswith(base + '/'):
+                        continue
+                    event_path = event_path[len(base):] or '/'
+
+                message = dumps({'path': event_path, 'data': data})
+                self.wfile.write('event: {}\ndata: {}\n\n'.format(event_type, message).encode())
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            self.database.unlisten(events)
+
+
+class FakeRTDBServer:
+    """HTTP server of a FakeDatabase on 127.0.0.1"""
+
+    def __init__(self, database, port=0):
+        """
+        FakeRTDBServer constructor
+        :param database: FakeDatabase
+        :param port: int, 0 picks a free port
+        """
+        handler = type('Handler', (_Handler,), {'database': database})
+        self.__http = ThreadingHTTPServer(('127.0.0.1', port), handler)
+        self.__http.daemon_threads = True
+        self.__thread = Thread(target=self.__http.serve_forever, name="fake-rtdb", daemon=True)
+
+    def start(self):
+        self.__thread.start()
+
+    def stop(self):
+        self.__http.shutdown()
+        self.__http.server_close()
+
+    @property
+    def port(self):
+        return self.__http.server_address[1]
+
+    def database_url(self, namespace='loadtest'):
+        """
+        return the emulator style url, firebase_admin talks to it without google credentials
+        :return: str
+        """
+        return 'http://127.0.0.1:{}?ns={}'.format(self.port, namespace)
+
+    def cert_url(self, client_email):
+        """
+        return a certificate url which the key checker of fb_module accepts
+        :return: str
+        """
+        return 'http://127.0.0.1:{}{}{}'.format(self.port, CERT_PATH, client_email.replace('@', '%40'))
@@ -0,0 +1,246 @@
+"""
+End to end load test of the server.
+
+A child process runs N snap7 servers whose datablocks change at a given rate
+and a fake realtime database. The real server runs in this process against
+both, and the time from a plc change to its upload is measured.
+
+Run from the server folder:
+    python -m load_test_folder.load_test --plcs 20 --fields 200 --rate 2 --duration 30
+"""
+from argparse import ArgumentParser
+from multiprocessing import Pipe, Process
+from tempfile import TemporaryDirectory
+from time import perf_counter, process_time, sleep
+from json import dump, dumps
+import builtins
+import os
+
+KEY_EMAIL = 'load-test@load-test.iam.gserviceaccount.com'
+
+
+def percentile(values, percent):
+    """
+    return the nearest rank percentile of values
+    :param values: sorted list
+    :param percent: float, 0 to 100
+    :return float or None
+    """
+    if not values:
+        return None
+
+    index = max(0, min(len(values) - 1, int(round(percent / 100 * len(values) + 0.5)) - 1))
+    return values[index]
+
+
+def write_key(path, cert_url):
+    """
+    write a service account key which the key checker and firebase_admin accept
+    :return:
+    """
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                            serialization.NoEncryption()).decode()
+
+    with open(path, 'w') as output:
+        dump({
+            'type': 'service_account',
+            'project_id': 'load-test',
+            'private_key_id': 'load-test',
+            'private_key': pem,
+            'client_email': KEY_EMAIL,
+            'client_id': '0',
+            'auth_uri': 'https://accounts.google.com/o/oauth2/auth',
+            'token_uri': 'https://oauth2.googleapis.com/token',
+            'auth_provider_x509_cert_url': 'https://www.googleapis.com/oauth2/v1/certs',
+            'client_x509_cert_url': cert_url,
+        }, output)
+
+
+class _Recorder:
+    """Collects the uploads which the fake database receives"""
+
+    def __init__(self, farm):
+        self.farm = farm
+        self.measuring = False
+        self.latencies = []
+        self.uploads = 0
+        self.paths = 0
+        self.created = set()
+
+    def on_write(self, method, path, data, now):
+        if method != 'patch' or path.strip('/') or not isinstance(data, dict):
+            return
+
+        for key in data:
+            parts = key.split('/')
+            if len(parts) == 2 and parts[1] == 'current':
+                # the new payload of a plc, it is created on the server
+                self.created.add(parts[0])
+
+        if not self.measuring:
+            return
+
+        self.uploads += 1
+        self.paths += len(data)
+
+        for foo in self.farm.plcs:
+            sequence = data.get(foo.plc_uid + '/current/datablocks/DB1/data/0/Value')
+            if sequence is not None:
+                changed_at = self.farm.changed_at(foo.plc_uid, sequence)
+                if changed_at is not None:
+                    self.latencies.append(now - changed_at)
+
+
+def _backend(connection, options):
+    """
+    run the plcs and the fake database until the load test is over
+    :param connection: multiprocessing connection
+    :param options: dict
+    :return:
+    """
+    from load_test_folder.fake_rtdb import FakeDatabase, FakeRTDBServer
+    from load_test_folder.plc_farm import PLCFarm
+
+    farm = PLCFarm(options['plcs'], options['base_port'], fields=options['fields'],
+                   datablocks=options['datablocks'], rate=options['rate'], change_ratio=options['change_ratio'])
+    recorder = _Recorder(farm)
+    database = FakeDatabase(on_write=recorder.on_write)
+    rtdb = FakeRTDBServer(database)
+
+    farm.start()
+    rtdb.start()
+    database.set('/', farm.nodes(options['poll_interval']))
+    connection.send({'database_url': rtdb.database_url(), 'cert_url': rtdb.cert_url(KEY_EMAIL)})
+
+    try:
+        started = perf_counter()
+        while len(recorder.created) < options['plcs']:
+            if perf_counter() - started > options['startup_timeout']:
+                break
+            sleep(0.05)
+        startup = perf_counter() - started
+
+        recorder.measuring = True
+        farm.start_changes()
+        connection.send({'startup': startup, 'created': len(recorder.created)})
+
+        sleep(options['duration'])
+        recorder.measuring = False
+        latencies = sorted(recorder.latencies)
+
+        connection.send({
+            'uploads': recorder.uploads,
+            'paths': recorder.paths,
+            'samples': len(latencies),
+            'latency': {'p50': percentile(latencies, 50), 'p90': percentile(latencies, 90),
+                        'p99': percentile(latencies, 99), 'max': latencies[-1] if latencies else None},
+        })
+    finally:
+        farm.stop()
+        rtdb.stop()
+
+
+def _children_cpu(before):
+    """
+    return the cpu seconds of the joined child processes since before
+    :param before: os.times result
+    :return float
+    """
+    after = os.times()
+    return after.children_user - before.children_user + after.children_system - before.children_system
+
+
+def run(options):
+    """
+    run a load test
+    :param options: dict, the command line options
+    :return dict, the report
+    """
+    from server_folder.server_module import server
+
+    connection, child = Pipe()
+    backend = Process(target=_backend, args=(child, options), daemon=True)
+    backend.start()
+    report = {'options': options}
+
+    try:
+        urls = connection.recv()
+
+        with TemporaryDirectory() as directory:
+            key_path = os.path.join(directory, 'key.json')
+            write_key(key_path, urls['cert_url'])
+            answers = iter(['4', 'y'])
+
+            def scripted_input(prompt=''):
+                if 'startup' not in report:
+                    report['startup'] = connection.recv()
+                    cpu, wall = process_time(), perf_counter()
+                    result = connection.recv()
+                    wall = perf_counter() - wall
+                    cpu = process_time() - cpu
+                    result['uploads_per_second'] = result['uploads'] / wall
+                    result['paths_per_second'] = result['paths'] / wall
+                    result['cpu_per_plc'] = cpu / wall / options['plcs']
+                    result['cpu_total'] = cpu / wall
+                    report['result'] = result
+                return next(answers)
+
+            builtins_input = builtins.input
+            builtins.input = scripted_input
+            children, started = os.times(), perf_counter()
+            try:
+                server.start_server(key_path, options={'databaseURL': urls['database_url']},
+                                    poll_workers=options['poll_workers'], use_asyncio=options['use_asyncio'],
+                                    journal_path=os.path.join(directory, 'journal.jsonl'), check_internet=False,
+                                    shards=options['shards'])
+            finally:
+                builtins.input = builtins_input
+
+            # the shard processes are joined when start_server returns, the backend is not joined yet,
+            # so the children times are the polls of the shards over their whole life
+            if 'result' in report:
+                shards = _children_cpu(children) / (perf_counter() - started)
+                report['result']['cpu_shards'] = shards
+                report['result']['cpu_total'] += shards
+                report['result']['cpu_per_plc'] = report['result']['cpu_total'] / options['plcs']
+    finally:
+        backend.join(10)
+        if backend.is_alive():
+            backend.terminate()
+
+    return report
+
+
+def main(argv=None):
+    parser = ArgumentParser(description="end to end load test with fake plcs and a fake realtime database")
+    parser.add_argument('--plcs', type=int, default=10)
+    parser.add_argument('--fields', type=int, default=100, help="fields of every datablock")
+    parser.add_argument('--datablocks', type=int, default=1, help="datablocks of every plc")
+    parser.add_argument('--rate', type=float, default=1.0, help="changes per second of every plc")
+    parser.add_argument('--change-ratio', type=float, default=0.1, help="ratio of the fields which a change touches")
+    parser.add_argument('--poll-interval', type=float, default=0.5)
+    parser.add_argument('--poll-workers', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=30.0, help="seconds which are measured")
+    parser.add_argument('--startup-timeout', type=float, default=120.0)
+    parser.add_argument('--base-port', type=int, default=20000, help="the plcs listen on base-port, base-port + 1, ...")
+    parser.add_argument('--use-asyncio', action='store_true')
+    parser.add_argument('--shards', type=int, default=1, help="worker processes which hold the plcs")
+    parser.add_argument('--output', default=None, help="json file, stdout if it is not given")
+    args = parser.parse_args(argv)
+
+    report = run(vars(args))
+    text = dumps(report, indent=2)
+
+    if args.output is None:
+        print(text)
+    else:
+        with open(args.output, 'w') as output:
+            output.write(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+from threading import Event, Thread
+from random import Random
+from time import perf_counter
+from snap7.server import Server
+from snap7.snap7types import srvAreaDB, S7WLByte, wordlen_to_ctypes
+from snap7.util import set_bool, set_int, set_real
+from benchmark_folder.benchmark import make_template
+from plc_folder.plc_util import create_bytearray
+
+SEQUENCE_DB = 1
+SEQUENCE_OFFSET = 0
+
+
+def sequence_path(plc_uid):
+    """
+    return the database path of the sequence field of a plc
+    :return: str
+    """
+    return '{}/current/datablocks/DB{}/data/0/Value'.format(plc_uid, SEQUENCE_DB)
+
+
+class FakePLC:
+    """A snap7 server whose datablocks have synthetic templates"""
+
+    def __init__(self, plc_uid, port, fields, datablocks, seed):
+        """
+        FakePLC constructor
+        :param plc_uid: str
+        :param port: int
+        :param fields: int, fields of every datablock
+        :param datablocks: int
+        :param seed: int
+        """
+        self.plc_uid = plc_uid
+        self.port = port
+        self.templates = {}
+        self.areas = {}
+        self.server = Server(log=False)
+        self.sequence = 0
+
+        for number in range(1, datablocks + 1):
+            template, size = make_template(fields, seed=seed * 1000 + number)
+            if number == SEQUENCE_DB:
+                # the first field of DB1 is the sequence which the latency is measured with
+                template = [{'Data_type': 'Int', 'Offset': SEQUENCE_OFFSET, 'Value': 0}] + \
+                           [dict(foo, Offset=shift(foo, 2)) for foo in template]
+                size += 2
+            area = (wordlen_to_ctypes[S7WLByte] * size)()
+            area[:] = create_bytearray(size=size, lst=template)
+            self.server.register_area(srvAreaDB, number, area)
+            self.templates[number] = (template, size)
+            self.areas[number] = area
+
+    def start(self):
+        self.server.start(tcpport=self.port)
+
+    def stop(self):
+        self.server.stop()
+        self.server.destroy()
+
+    def node(self, poll_interval):
+        """
+        return the database node which creates this plc on the server
+        :param poll_interval: float
+        :return: dict
+        """
+        datablocks = {'data_block_names': []}
+        for number, (template, size) in self.templates.items():
+            name = 'DB{}'.format(number)
+            datablocks['data_block_names'].append(name)
+            datablocks[name] = {'size': size, 'data': template}
+
+        return {
+            'plc_name': self.plc_uid,
+            'changer_id': 'other',
+            'permission': {'to_write': False},
+            'new': {'plc_informations': {}, 'datablocks': datablocks},
+            'plc_parameters': {'Ip_Address': '127.0.0.1', 'Rack': 0, 'Slot': 1, 'Port': self.port,
+                               'Poll_Interval': poll_interval}
+        }
+
+    def mutate(self, rng, change_ratio):
+        """
+        change change_ratio of the fields and increase the sequence
+        :return: int, the new sequence
+        """
+        for number, (template, size) in self.templates.items():
+            fields = template[1:] if number == SEQUENCE_DB else template
+            count = int(len(fields) * change_ratio)
+            if not count:
+                continue
+
+            holder = bytearray(self.areas[number])
+            for foo in rng.sample(fields, count):
+                if foo['Data_type'] == 'Bool':
+                    byte, bit = str(float(foo['Offset'])).split('.')
+                    set_bool(holder, int(byte), int(bit), rng.random() < 0.5)
+                elif foo['Data_type'] == 'Int':
+                    set_int(holder, foo['Offset'], rng.randint(-32768, 32767))
+                elif foo['Data_type'] == 'Real':
+                    set_real(holder, foo['Offset'], rng.uniform(-1000, 1000))
+
+            self.__store(number, holder)
+
+        self.sequence = (self.sequence + 1) % 32768
+        holder = bytearray(self.areas[SEQUENCE_DB])
+        set_int(holder, SEQUENCE_OFFSET, self.sequence)
+        self.__store(SEQUENCE_DB, holder)
+        return self.sequence
+
+    def __store(self, number, holder):
+        self.server.lock_area(srvAreaDB, number)
+        try:
+            self.areas[number][:] = holder
+        finally:
+            self.server.unlock_area(srvAreaDB, number)
+
+
+def shift(entry, count):
+    """
+    move the offset of a template entry count bytes forward
+    """
+    if entry['Data_type'] == 'Bool':
+        byte, bit = str(float(entry['Offset'])).split('.')
+        return float('{}.{}'.format(int(byte) + count, bit))
+
+    return entry['Offset'] + count
+
+
+class PLCFarm:
+    """
+    Fake plcs whose datablocks are changed rate times per second. The time of
+    every sequence value is kept, so an upload of it gives the end to end latency.
+    """
+
+    def __init__(self, count, base_port, fields=100, datablocks=1, rate=1.0, change_ratio=0.1, seed=0):
+        """
+        PLCFarm constructor
+        :param count: int, plcs
+        :param base_port: int, the plcs listen on base_port, base_port + 1, ...
+        :param fields: int, fields of every datablock
+        :param datablocks: int, datablocks of every plc
+        :param rate: float, changes per second of every plc
+        :param change_ratio: float, ratio of the fields which a change touches
+        :param seed: int
+        """
+        self.__plcs = [FakePLC('plc{:04d}'.format(foo), base_port + foo, fields, datablocks, seed + foo)
+                       for foo in range(count)]
+        self.__rate = rate
+        self.__change_ratio = change_ratio
+        self.__rng = Random(seed)
+        self.__changed_at = {}
+        self.__stop = Event()
+        self.__thread = Thread(target=self.__run, name="plc-farm", daemon=True)
+
+    def start(self):
+        for foo in self.__plcs:
+            foo.start()
+
+    def start_changes(self):
+        self.__thread.start()
+
+    def stop(self):
+        self.__stop.set()
+        if self.__thread.is_alive():
+            self.__thread.join()
+        for foo in self.__plcs:
+            foo.stop()
+
+    def nodes(self, poll_interval):
+        """
+        return the database nodes of every plc
+        :return: dict {plc_uid: node}
+        """
+        return {foo.plc_uid: foo.node(poll_interval) for foo in self.__plcs}
+
+    def changed_at(self, plc_uid, sequence):
+        """
+        return when a sequence value was written to a plc
+        :return: float perf_counter time or None
+        """
+        return self.__changed_at.get((plc_uid, sequence))
+
+    def __run(self):
+        """
+        change the plcs at rate, the changes are spread over each period
+        :return:
+        """
+        period = 1.0 / self.__rate
+        step = period / len(self.__plcs)
+        due = perf_counter()
+
+        while not self.__stop.is_set():
+            for foo in self.__plcs:
+                delay = due - perf_counter()
+                if delay > 0 and self.__stop.wait(delay):
+                    return
+                sequence = foo.mutate(self.__rng, self.__change_ratio)
+                self.__changed_at[(foo.plc_uid, sequence)] = perf_counter()
+                due += step
+
+    @property
+    def plcs(self):
+        return self.__plcs
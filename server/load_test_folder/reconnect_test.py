@@ -0,0 +1,115 @@
+"""
+Reconnect test of a plc against a fake plc.
+
+The client of the plc is dropped while its session is connected, the poll must
+mark it lost and the background reconnects must connect it again. Then the fake
+plc is stopped, the plc must be marked lost and back off without blocking its
+polls. The fake plc is started again on the same port and the plc must be
+reconnected by the background reconnects.
+
+Run from the server folder:
+    python -m load_test_folder.reconnect_test --port 20100
+"""
+from argparse import ArgumentParser
+from time import perf_counter, sleep
+from plc_folder import plc, plc_exception
+from plc_folder.plc_connection import connection_manager, CONNECTED, BACKING_OFF
+from load_test_folder.plc_farm import FakePLC
+
+PLC_UID = 'reconnect'
+SEED = 7
+
+
+def poll(value):
+    """
+    poll a plc like the scheduler of the server does
+    :param value: plc.PLC
+    :return: Boolean, whether the plc was read
+    """
+    if not value.plc_connection_info:
+        return False
+
+    try:
+        value.data_from_plc
+    except plc_exception.MissingConnection:
+        return False
+    return True
+
+
+def wait_for(value, state, timeout):
+    """
+    poll a plc until its session is in a state
+    :param value: plc.PLC
+    :param state: str
+    :param timeout: float, seconds
+    :return: float, seconds which it took
+    :raise AssertionError
+    """
+    started = perf_counter()
+    while value.connection_state != state:
+        if perf_counter() - started > timeout:
+            raise AssertionError("plc is {}, not {}".format(value.connection_state, state))
+        poll(value)
+        sleep(0.05)
+
+    return perf_counter() - started
+
+
+def run(port, fields, outage, timeout):
+    """
+    drop and restart a fake plc
+    :param port: int
+    :param fields: int
+    :param outage: float, seconds which the fake plc is stopped
+    :param timeout: float, seconds which a step may take
+    :return: dict, seconds of the steps
+    :raise AssertionError
+    """
+    fake = FakePLC(PLC_UID, port, fields, 1, SEED)
+    fake.start()
+    value = plc.PLC(plc_uid=PLC_UID, **fake.node(0.1))
+
+    try:
+        assert value.plc_connection_info, "plc is not connected"
+        assert poll(value), "plc could not be read"
+
+        # the socket drops, the session still says connected
+        for foo in connection_manager.sessions:
+            foo.disconnect()
+        dropped = wait_for(value, BACKING_OFF, timeout)
+        wait_for(value, CONNECTED, timeout)
+        assert poll(value), "plc could not be read after the drop"
+
+        fake.stop()
+        lost = wait_for(value, BACKING_OFF, timeout)
+        started = perf_counter()
+        assert not poll(value), "a stopped plc was read"
+        assert perf_counter() - started < 1.0, "a poll of a lost plc waited for the cpu"
+
+        sleep(outage)
+        fake = FakePLC(PLC_UID, port, fields, 1, SEED)
+        fake.start()
+        back = wait_for(value, CONNECTED, timeout)
+        assert poll(value), "reconnected plc could not be read"
+    finally:
+        value.disconnect()
+        fake.stop()
+
+    return {'dropped': dropped, 'lost': lost, 'reconnected': back}
+
+
+def main(argv=None):
+    parser = ArgumentParser(description="drop a fake plc and check that the plc backs off and reconnects")
+    parser.add_argument('--port', type=int, default=20100)
+    parser.add_argument('--fields', type=int, default=20, help="fields of the datablock")
+    parser.add_argument('--outage', type=float, default=1.0, help="seconds which the fake plc is stopped")
+    parser.add_argument('--timeout', type=float, default=40.0, help="seconds which a step may take")
+    args = parser.parse_args(argv)
+
+    result = run(args.port, args.fields, args.outage, args.timeout)
+    print("dropped client lost after {dropped:.3f}s, stopped plc lost after {lost:.3f}s, "
+          "reconnected after {reconnected:.3f}s".format(**result))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,14 @@
-from snap7 import client, snap7exceptions
+from snap7 import snap7exceptions
 from plc_folder.plc_models import Version_Model
+from plc_folder.plc_transfer import TransferPlan, write_ranges
+from plc_folder.plc_layout import changed_ranges
+from plc_folder.plc_connection import connection_manager, DEFAULT_TIMEOUT
+from plc_folder.plc_verify import layout_verifier
 from plc_folder import plc_exception
-from copy import deepcopy
 
 
-class PLC(client.Client):
-    """A PLC object"""
+class PLC:
+    """A PLC object, it talks to the cpu through a shared session of connection_manager"""
 
     def __init__(self, **kwargs):
         """
@@ -14,14 +17,15 @@ class PLC(client.Client):
         :raise plc_exception.DatabaseError
         """
 
-        super().__init__()
-
         self.__new = None
         self.__current = None
         self.__old_data = None
+        self.__transfer = None
         self.__plc_name = kwargs['plc_name']
         self.__plc_uid = kwargs['plc_uid']
-        self.__db_read = client.Client()
+        self.__session = None
+        self.__bytes_read = 0
+        self.__bytes_written = 0
 
         if 'new' in kwargs:
             self.__new = Version_Model(_name='new', plc_name=kwargs['plc_name'], **kwargs['new'])
@@ -34,13 +38,23 @@ class PLC(client.Client):
             kwargs['plc_parameters']['Slot'],
             kwargs['plc_parameters']['Port']
         )
+        self.__poll_interval = float(kwargs['plc_parameters'].get('Poll_Interval', 1))
+        self.__timeout = float(kwargs['plc_parameters'].get('Timeout', DEFAULT_TIMEOUT))
 
         self.__plc_connection()
-        self.__upload_new_data()
-
-    def update_plc(self, **kwargs):
+        try:
+            self.__upload_new_data()
+        except (plc_exception.MissingConnection, plc_exception.WriteError):
+            # the cpu is unreachable now, new is written when the session is reconnected
+            print("new of {} is written when it is connected".format(self.__plc_uid))
+        except Exception:
+            self.disconnect()
+            raise
+
+    def update_plc(self, _changed=None, **kwargs):
         """
         update method to update plc's current datablock
+        :param _changed: dict {datablock name: changed fields} or None, the other datablocks are reused from old_data
         :param kwargs:
         :return:
         :raises
@@ -50,12 +64,11 @@ class PLC(client.Client):
         if 'current' not in kwargs:
             raise plc_exception.DatabaseError("current does not exist in the database")
 
-        try:
-            self.__check_connection()
-        except plc_exception.MissingConnection:
-            self.__try_connection()
+        self.__check_connection()
+        self.__flush_new()
 
-        self.__current = Version_Model(_name='current', **kwargs['current'])
+        self.__current = Version_Model(_name='current', previous=self.__old_data, changed=_changed,
+                                       **kwargs['current'])
         if self.__plc_name != kwargs['plc_name']:
             self.__plc_name = kwargs['plc_name']
         self.__check_datablock_size(_type='current')
@@ -72,20 +85,19 @@ class PLC(client.Client):
         if not self.__current:
             raise plc_exception.CurrentError("Current data is empty.")
 
-        try:
-            self.__check_connection()
-        except plc_exception.MissingConnection:
-            self.__try_connection()
+        self.__check_connection()
 
-        for foo in self.__current.datablocks:
+        with self.__session.lease() as _client:
             try:
-                self.db_write(foo.datablock_number, 0, foo.datablock)
+                self.__write_changes(_client, self.__current)
             except snap7exceptions.Snap7Exception as Error:
                 print("error is: ", Error)
+                layout_verifier.invalidate(self.__parameters)
+                connection_manager.lost(self.__session)
                 raise plc_exception.WriteError("something was wrong")
 
-        self.__old_data = deepcopy(self.__current)
-        self.__old_data.name = 'old_data'
+        self.__old_data = self.__current.snapshot('old_data')
+        self.__prepare_transfer()
         del self.__current
         self.__current = None
 
@@ -113,56 +125,96 @@ class PLC(client.Client):
         self.__check_connection()
         self.__check_datablock_size(_type='new')
 
-        for foo in self.__new.datablocks:
+        with self.__session.lease() as _client:
             try:
-                self.db_write(foo.datablock_number, 0, foo.datablock)
+                self.__write_changes(_client, self.__new)
             except snap7exceptions.Snap7Exception:
+                layout_verifier.invalidate(self.__parameters)
+                connection_manager.lost(self.__session)
                 raise plc_exception.WriteError("something was wrong")
 
-        self.__old_data = deepcopy(self.__new)
-        self.__old_data.name = 'old_data'
+        self.__old_data = self.__new.snapshot('old_data')
+        self.__prepare_transfer()
         del self.__new
         self.__new = None
 
+    def __flush_new(self):
+        """
+        Write new, which could not be written while the cpu was unreachable at bring-up
+        :return:
+        :raises
+            plc_exception.MissingConnection
+            plc_exception.WriteError
+        """
+        if self.__old_data is None and self.__new is not None:
+            self.__upload_new_data()
+
+    def __write_changes(self, _client, model):
+        """
+        Write only the bytes of model's datablocks which differ from the last known plc image.
+        A datablock without a known image is written whole.
+        :param _client: leased snap7 client
+        :param model: Version_Model
+        :return:
+        :raise snap7exceptions.Snap7Exception
+        """
+        known = {}
+        if self.__old_data:
+            known = {foo.datablock_number: foo.datablock for foo in self.__old_data.datablocks}
+
+        images = {}
+        ranges = []
+
+        for foo in model.datablocks:
+            number = foo.datablock_number
+            images[number] = foo.datablock
+            image = known.get(number)
+
+            if image is None or len(image) != len(foo.datablock):
+                ranges.append((number, 0, len(foo.datablock)))
+            else:
+                ranges.extend((number, start, end - start) for start, end in changed_ranges(image, foo.datablock))
+
+        if ranges:
+            write_ranges(_client, images, ranges)
+            self.__bytes_written += sum(foo[2] for foo in ranges)
+
+    def __prepare_transfer(self):
+        """
+        Create the transfer plan of old_data's datablocks, the plan is kept while the datablocks are same
+        :return:
+        """
+        areas = [(foo.datablock_number, foo.size) for foo in self.__old_data.datablocks]
+
+        if self.__transfer is None or self.__transfer.areas != areas:
+            self.__transfer = TransferPlan(areas)
+
     def __plc_connection(self):
         """
-        Connect the PLC
+        Connect the PLC, an unreachable cpu is reconnected with backoff by connection_manager
         :return
-        :raise plc_exception.PLCConnectionError
         """
 
-        try:
-            self.connect(*self.__parameters)
-            self.__db_read.connect(*self.__parameters)
-            print(*self.__parameters)
-        except snap7exceptions.Snap7Exception:
-            raise plc_exception.PLCConnectionError("Parameters are not correct.")
+        self.__session = connection_manager.acquire(self.__parameters, self.__timeout)
+        print(*self.__parameters)
 
     def __check_connection(self):
         """
-        Check if the plc is connected
+        Check if the plc is connected, a lost session is reconnected by connection_manager
+        and not here, so a dead cpu does not block the caller
         :return
-        :raise plc_exception.InitializeError
+        :raises
+            plc_exception.InitializeError
+            plc_exception.MissingConnection
         """
         try:
-            if not self.get_connected() or not self.__db_read.get_connected():
-                self.__try_connection()
+            connected = self.__session.connected
         except AttributeError:
             raise plc_exception.InitializeError("PLC object is not correct")
 
-    def __try_connection(self):
-        """
-        try to connect plc
-        :return
-        :raise plc_exception.PLCConnectionError
-        """
-
-        self.disconnect()
-        self.__db_read.disconnect()
-        self.__plc_connection()
-
-        if not self.get_connected() or not self.__db_read.get_connected():
-            raise plc_exception.PLCConnectionError("PLC isn't been connecting")
+        if not connected:
+            connection_manager.lost(self.__session)
+            raise plc_exception.MissingConnection("{} is {}".format(self.__parameters, self.__session.state))
 
     def __check_datablock_size(self, _type):
         """
@@ -183,17 +235,8 @@ class PLC(client.Client):
                 if not self.__new:
                     raise plc_exception.NewError("New is empty")
 
-                for foo in self.__new.datablocks:
-                    try:
-                        self.__db_read.db_read(foo.datablock_number, 0, foo.size)
-                    except snap7exceptions.Snap7Exception:
-                        raise plc_exception.DatablockSizeError("Datablock size is smaller than a plc's size.")
-
-                    try:
-                        self.__db_read.db_read(foo.datablock_number, 0, foo.size + 2)
-                        raise plc_exception.DatablockSizeError("Datablock size is bigger than a plc's size. ")
-                    except snap7exceptions.Snap7Exception:
-                        continue
+                with self.__session.lease() as _client:
+                    layout_verifier.verify(self.__session, _client, self.__new.datablocks)
 
             elif _type == 'current':
                 if not self.__current:
@@ -221,21 +264,32 @@ class PLC(client.Client):
         """
         Data to upload firebase
         :return: list contains tuples or None
-        :raise plc_exception.OldDataError
+        :raises
+            plc_exception.OldDataError
+            plc_exception.MissingConnection
         """
 
+        self.__check_connection()
+        self.__flush_new()
+
         if not self.__old_data or not isinstance(self.__old_data, Version_Model):
             raise plc_exception.OldDataError("Old data is not correct")
 
-        self.__check_connection()
-
         holder_database = [self.__plc_uid]
+        with self.__session.lease() as _client:
+            try:
+                images = self.__transfer.read(_client)
+            except snap7exceptions.Snap7Exception:
+                connection_manager.lost(self.__session)
+                raise plc_exception.MissingConnection("{} could not be read".format(self.__parameters))
+        self.__bytes_read += sum(len(foo) for foo in images.values())
 
         for foo in list(self.__old_data.datablocks):
 
-            db_read = self.__db_read.db_read(foo.datablock_number, 0, foo.size)
+            db_read = images[foo.datablock_number]
 
-            if foo.datablock != db_read:
+            # held fields are published when their interval ends, even if the plc does not change them
+            if foo.datablock != db_read or foo.has_held:
                 holder_database.append(foo.create_data_for_fb(_bytearray=db_read))
 
         if not holder_database[1:]:
@@ -252,14 +306,82 @@ class PLC(client.Client):
 
         return self.__parameters
 
+    @property
+    def bytes_read(self):
+        """
+        Return bytes which were read from the plc
+        :return int
+        """
+
+        return self.__bytes_read
+
+    @property
+    def bytes_written(self):
+        """
+        Return bytes which were written to the plc
+        :return int
+        """
+
+        return self.__bytes_written
+
+    @property
+    def reconnects(self):
+        """
+        Return how many times the session of the plc was connected again
+        :return int
+        """
+
+        if self.__session is None:
+            return 0
+        return max(0, self.__session.generation - 1)
+
+    @property
+    def poll_interval(self):
+        """
+        Return seconds between two polls
+        :return float
+        """
+
+        return self.__poll_interval
+
     @property
     def plc_connection_info(self):
         """
-        Return the state of plc
+        Return the state of plc, a socket which dropped while the session is connected
+        marks the session as lost, so it is reconnected with backoff
         :return Boolean
         """
 
-        return self.get_connected()
+        if self.__session is None:
+            return False
+
+        if self.__session.connected:
+            return True
+
+        connection_manager.lost(self.__session)
+        return False
+
+    @property
+    def connection_state(self):
+        """
+        Return connected, backing off or open circuit
+        :return str
+        """
+
+        if self.__session is None:
+            return 'released'
+        return self.__session.state
+
+    def disconnect(self):
+        """
+        Release the session, the cpu is disconnected when no other plc entry uses it
+        :return:
+        """
+        if self.__session is None:
+            return
+
+        connection_manager.release(self.__session)
+        self.__session = None
 
     @property
     def plc_name(self):
@@ -0,0 +1,346 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from threading import Condition, RLock, Thread
+from random import uniform
+from time import monotonic
+from snap7 import client, snap7exceptions
+from snap7.snap7types import PingTimeout, SendTimeout, RecvTimeout
+from plc_folder import plc_exception
+import logging
+
+# seconds, an unreachable cpu fails after it instead of the tcp timeout
+DEFAULT_TIMEOUT = 3.0
+
+CONNECTED = 'connected'
+BACKING_OFF = 'backing off'
+OPEN_CIRCUIT = 'open circuit'
+STATES = (CONNECTED, BACKING_OFF, OPEN_CIRCUIT)
+
+# seconds before the first reconnect, it doubles after every failed reconnect up to BACKOFF_MAX
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 30.0
+# failed reconnects after which the circuit opens, an open circuit is tried once every OPEN_INTERVAL
+OPEN_AFTER = 8
+OPEN_INTERVAL = 120.0
+# sessions which are reconnected at the same time, a dead cpu blocks one worker for DEFAULT_TIMEOUT
+RECONNECT_WORKERS = 8
+
+
+class Session:
+    """One S7 connection to a cpu, access to it is serialized"""
+
+    def __init__(self, parameters, timeout=DEFAULT_TIMEOUT):
+        """
+        Session constructor
+        :param parameters: tuple (ip_address, rack, slot, port)
+        :param timeout: float, seconds of connecting, sending and receiving
+        """
+        self.__parameters = parameters
+        self.__timeout = timeout
+        self.__client = self.__new_client()
+        self.__lock = RLock()
+        self.__users = 0
+        self.__generation = 0
+        self.__state = BACKING_OFF
+        self.__failures = 0
+        self.__retry_at = 0.0
+
+    def __new_client(self):
+        """
+        Return a snap7 client with the timeouts of the session
+        :return: snap7 client
+        """
+        _client = client.Client()
+        for foo in (PingTimeout, SendTimeout, RecvTimeout):
+            _client.set_param(foo, int(self.__timeout * 1000))
+        return _client
+
+    def connect(self):
+        """
+        (Re)connect the session. A new client connects without the lock, so the users of
+        the session are not blocked for the timeout, and it replaces the old client
+        :return:
+        :raise snap7exceptions.Snap7Exception
+        """
+        _client = self.__new_client()
+        _client.connect(*self.__parameters)
+
+        with self.__lock:
+            self.__client.disconnect()
+            self.__client = _client
+            self.__generation += 1
+            self.__state = CONNECTED
+            self.__failures = 0
+            logging.info("connected to {}".format(self.__parameters))
+
+    def lost(self):
+        """
+        Mark the connection as lost, the reconnects are scheduled with backoff
+        :return: Boolean, whether the session was connected until now
+        """
+        if self.__state != CONNECTED:
+            # it is lost already, a poll does not wait for the session
+            return False
+
+        with self.__lock:
+            if self.__state != CONNECTED:
+                return False
+
+            self.__client.disconnect()
+            self.__failures = 0
+            self.__schedule()
+            logging.warning("connection to {} is lost".format(self.__parameters))
+            return True
+
+    def reconnect(self):
+        """
+        Try to connect a lost session once, a failure schedules the next try
+        :return: Boolean, whether it is connected
+        """
+        if self.__state == CONNECTED:
+            return True
+
+        try:
+            self.connect()
+        except snap7exceptions.Snap7Exception:
+            with self.__lock:
+                self.__failures += 1
+                self.__schedule()
+            return False
+
+        logging.warning("connection to {} is back".format(self.__parameters))
+        return True
+
+    def __schedule(self):
+        """
+        Set the state and the time of the next reconnect, the delay has jitter
+        so the sessions of a dropped network do not reconnect all at once
+        :return:
+        """
+        if self.__failures >= OPEN_AFTER:
+            if self.__state != OPEN_CIRCUIT:
+                logging.warning("circuit of {} is open".format(self.__parameters))
+            self.__state = OPEN_CIRCUIT
+            delay = OPEN_INTERVAL
+        else:
+            self.__state = BACKING_OFF
+            delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** self.__failures)
+
+        self.__retry_at = monotonic() + delay * uniform(0.5, 1.5)
+
+    def disconnect(self):
+        """
+        Disconnect the session
+        :return:
+        """
+        with self.__lock:
+            self.__client.disconnect()
+
+    @contextmanager
+    def lease(self):
+        """
+        Lend the client, nobody else uses the session until the lease ends
+        :return: snap7 client
+        :raise plc_exception.MissingConnection
+        """
+        with self.__lock:
+            if not self.__client.get_connected():
+                raise plc_exception.MissingConnection("Session is not connected")
+            yield self.__client
+
+    @property
+    def connected(self):
+        """
+        Return whether the session is connected, it does not wait for the session
+        :return: Boolean
+        """
+        return self.__state == CONNECTED and self.__client.get_connected()
+
+    @property
+    def state(self):
+        """
+        Return connected, backing off or open circuit
+        :return: str
+        """
+        return self.__state
+
+    @property
+    def retry_at(self):
+        """
+        Return the monotonic time of the next reconnect
+        :return: float
+        """
+        return self.__retry_at
+
+    @property
+    def generation(self):
+        """
+        Return how many times the session was connected, it changes on every reconnect
+        :return: int
+        """
+        return self.__generation
+
+    @property
+    def parameters(self):
+        """
+        Return ip_address, rack, slot and port
+        :return: tuple
+        """
+        return self.__parameters
+
+    @property
+    def users(self):
+        """
+        Return how many plc entries use the session
+        :return: int
+        """
+        return self.__users
+
+    @users.setter
+    def users(self, value):
+        """set the __users"""
+        self.__users = value
+
+
+class ConnectionManager:
+    """
+    Owns S7 sessions keyed by (ip_address, rack, slot, port). Lost sessions are
+    reconnected by its reconnect thread, so polls never wait for a dead cpu.
+    """
+
+    def __init__(self):
+        """
+        ConnectionManager constructor
+        """
+        self.__sessions = {}
+        self.__lock = Condition()
+        self.__reconnector = None
+        self.__reconnecting = set()
+        self.__pool = ThreadPoolExecutor(max_workers=RECONNECT_WORKERS, thread_name_prefix='reconnect')
+
+    def acquire(self, parameters, timeout=DEFAULT_TIMEOUT):
+        """
+        Return the session of a cpu, a cpu which is unreachable now is kept and reconnected with backoff
+        :param parameters: tuple (ip_address, rack, slot, port)
+        :param timeout: float, seconds of connecting, sending and receiving of a new session
+        :return Session
+        """
+        parameters = tuple(parameters)
+
+        with self.__lock:
+            session = self.__sessions.get(parameters)
+            created = session is None
+            if created:
+                session = Session(parameters, timeout)
+                self.__sessions[parameters] = session
+                # the reconnect thread does not connect it at the same time
+                self.__reconnecting.add(session)
+            session.users += 1
+
+        if not created:
+            if not session.connected:
+                self.lost(session)
+            return session
+
+        # connecting is slow, other cpus are not blocked meanwhile
+        try:
+            if not session.reconnect():
+                logging.warning("{} is unreachable, it is reconnected with backoff".format(parameters))
+        finally:
+            with self.__lock:
+                self.__reconnecting.discard(session)
+                if session.state != CONNECTED:
+                    self.__wake()
+
+        return session
+
+    def release(self, session):
+        """
+        Release a session, it is disconnected when nobody uses it
+        :param session: Session
+        :return:
+        """
+        with self.__lock:
+            session.users -= 1
+            if session.users > 0:
+                return
+
+            if self.__sessions.get(session.parameters) is session:
+                del self.__sessions[session.parameters]
+
+        session.disconnect()
+
+    def lost(self, session):
+        """
+        Mark a session as lost and wake the reconnect thread
+        :param session: Session
+        :return:
+        """
+        if not session.lost():
+            return
+
+        with self.__lock:
+            self.__wake()
+
+    def __wake(self):
+        """
+        Start the reconnect thread or wake it, the lock must be held
+        :return:
+        """
+        if self.__reconnector is None:
+            self.__reconnector = Thread(target=self.__reconnect, name="reconnect", daemon=True)
+            self.__reconnector.start()
+        self.__lock.notify()
+
+    def __reconnect(self):
+        """
+        Hand the lost sessions to the reconnect workers when their tries are due,
+        it ends when every session is connected
+        :return:
+        """
+        while True:
+            with self.__lock:
+                lost = [foo for foo in self.__sessions.values()
+                        if foo.state != CONNECTED and foo not in self.__reconnecting]
+                if not lost and not self.__reconnecting:
+                    self.__reconnector = None
+                    return
+
+                now = monotonic()
+                due = [foo for foo in lost if foo.retry_at <= now]
+                if not due:
+                    # a finished try notifies, it schedules its next try
+                    self.__lock.wait(min(foo.retry_at for foo in lost) - now if lost else None)
+                    continue
+
+                self.__reconnecting.update(due)
+
+            for foo in due:
+                self.__pool.submit(self.__try, foo)
+
+    def __try(self, session):
+        """
+        Try to reconnect a session once on a reconnect worker
+        :param session: Session
+        :return:
+        """
+        try:
+            if session.reconnect() and session.users <= 0:
+                # it was released while it was connecting
+                session.disconnect()
+        finally:
+            with self.__lock:
+                self.__reconnecting.discard(session)
+                self.__lock.notify()
+
+    @property
+    def sessions(self):
+        """
+        Return the open sessions
+        :return: list contains Session
+        """
+        with self.__lock:
+            return list(self.__sessions.values())
+
+
+connection_manager = ConnectionManager()
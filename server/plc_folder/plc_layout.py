@@ -0,0 +1,509 @@
+from struct import Struct
+from hashlib import sha256
+
+STRING_SIZE = 256
+CHUNK_SIZE = 256
+DEADBAND_TYPES = ('absolute', 'percent')
+
+_INT = Struct('>h')
+_REAL = Struct('>f')
+
+
+def _decode_bool(_bytearray, byte, bit):
+    return _bytearray[byte] >> bit & 1 == 1
+
+
+def _decode_int(_bytearray, byte, bit):
+    return _INT.unpack_from(_bytearray, byte)[0]
+
+
+def _decode_real(_bytearray, byte, bit):
+    return _REAL.unpack_from(_bytearray, byte)[0]
+
+
+def _decode_string(_bytearray, byte, bit):
+    size = min(_bytearray[byte + 1], STRING_SIZE)
+    return _bytearray[byte + 2: byte + 2 + size].decode('latin-1')
+
+
+def _encode_bool(_bytearray, byte, bit, value):
+    if value not in (0, 1):
+        raise ValueError("bool error")
+    if value:
+        _bytearray[byte] |= 1 << bit
+    else:
+        _bytearray[byte] &= ~(1 << bit) & 0xff
+
+
+def _encode_int(_bytearray, byte, bit, value):
+    _INT.pack_into(_bytearray, byte, int(value))
+
+
+def _encode_real(_bytearray, byte, bit, value):
+    _REAL.pack_into(_bytearray, byte, float(value))
+
+
+def _encode_string(_bytearray, byte, bit, value):
+    # the length is written at byte + 1, the max length at byte is left as it is
+    if not isinstance(value, str):
+        raise ValueError("string error")
+
+    raw = value.encode('latin-1')
+    if len(raw) > STRING_SIZE or byte + 2 + len(raw) > len(_bytearray):
+        raise ValueError("string error")
+
+    _bytearray[byte + 1] = len(raw)
+    _bytearray[byte + 2: byte + 2 + len(raw)] = raw
+
+
+def _patch_string(_bytearray, byte, bit, value):
+    # the characters of a longer old value are cleared, like in a new image
+    old = _bytearray[byte + 1]
+    _encode_string(_bytearray, byte, bit, value)
+    size = _bytearray[byte + 1]
+    if old > size:
+        end = min(byte + 2 + old, len(_bytearray))
+        _bytearray[byte + 2 + size: end] = bytes(end - byte - 2 - size)
+
+
+def changed_ranges(old, new, chunk_size=CHUNK_SIZE):
+    """
+    Find the byte ranges which differ between two images of the same size.
+    Equal chunks are skipped with a memory compare, a different chunk is
+    scanned byte by byte through the xor of both chunks.
+    :param old: bytes or bytearray
+    :param new: bytes or bytearray
+    :param chunk_size: int
+    :return list contains tuples (start, end)
+    """
+    old, new = memoryview(old), memoryview(new)
+    ranges = []
+
+    for begin in range(0, len(new), chunk_size):
+        end = begin + chunk_size
+        if old[begin:end] == new[begin:end]:
+            continue
+
+        diff = int.from_bytes(old[begin:end], 'little') ^ int.from_bytes(new[begin:end], 'little')
+        while diff:
+            byte = ((diff & -diff).bit_length() - 1) >> 3
+            diff &= ~(0xff << (byte << 3))
+            byte += begin
+
+            if ranges and ranges[-1][1] == byte:
+                ranges[-1] = (ranges[-1][0], byte + 1)
+            else:
+                ranges.append((byte, byte + 1))
+
+    return ranges
+
+
+class Codec:
+    """Decoder and encoder of one plc data type"""
+
+    __slots__ = ('data_type', 'size', 'decode', 'encode')
+
+    def __init__(self, data_type, size, decode, encode):
+        """
+        Codec constructor
+        :param data_type: str
+        :param size: int, bytes used in a datablock
+        :param decode: function (bytearray, byte, bit) -> value
+        :param encode: function (bytearray, byte, bit, value)
+        """
+        self.data_type = data_type
+        self.size = size
+        self.decode = decode
+        self.encode = encode
+
+
+CODECS = {
+    'Bool': Codec('Bool', 1, _decode_bool, _encode_bool),
+    'Int': Codec('Int', _INT.size, _decode_int, _encode_int),
+    'Real': Codec('Real', _REAL.size, _decode_real, _encode_real),
+    'String': Codec('String', STRING_SIZE + 2, _decode_string, _encode_string),
+}
+
+
+class TagFilter:
+    """Deadband and minimum publish interval of one field"""
+
+    __slots__ = ('deadband', 'percent', 'min_interval')
+
+    def __init__(self, deadband=0.0, percent=False, min_interval=0.0):
+        """
+        TagFilter constructor
+        :param deadband: float, a change must be bigger than it to be published
+        :param percent: boolean, the deadband is a percentage of the last published value
+        :param min_interval: float, seconds which must pass between two publishes
+        """
+        self.deadband = deadband
+        self.percent = percent
+        self.min_interval = min_interval
+
+    def exceeds(self, published, value):
+        """
+        whether a value is out of the deadband of the last published value
+        :return Boolean
+        """
+        if published is None or not self.deadband:
+            return published != value
+
+        limit = abs(published) * self.deadband / 100 if self.percent else self.deadband
+        return not abs(value - published) <= limit
+
+    @staticmethod
+    def from_entry(data_type, entry):
+        """
+        Read Deadband, Deadband_Type and Min_Interval of a template entry
+        :param data_type: str
+        :param entry: dict
+        :return TagFilter or None when the entry has no filter
+        :raise ValueError
+        """
+        deadband = entry.get('Deadband')
+        min_interval = entry.get('Min_Interval')
+        if not deadband and not min_interval:
+            return None
+
+        try:
+            deadband = float(deadband or 0)
+            min_interval = float(min_interval or 0)
+        except (TypeError, ValueError):
+            raise ValueError("deadband error")
+
+        deadband_type = str(entry.get('Deadband_Type', 'absolute')).lower()
+        if deadband < 0 or min_interval < 0 or deadband_type not in DEADBAND_TYPES:
+            raise ValueError("deadband error")
+        if deadband and data_type not in ('Int', 'Real'):
+            raise ValueError("deadband error")
+
+        return TagFilter(deadband, deadband_type == 'percent', min_interval)
+
+
+def split_offset(data_type, offset):
+    """
+    Split a template offset into byte and bit
+    :param data_type: str
+    :param offset: int, float or str
+    :return tuple (byte, bit)
+    """
+    if data_type == 'Bool':
+        byte, bit = str(float(offset)).split('.')
+        return int(byte), int(bit)
+
+    return int(float(offset)), 0
+
+
+class Encoder:
+    """
+    Compiled encoder of a datablock template. The Int and Real fields are packed with one
+    precomputed struct format, Bools are set with precomputed masks and Strings are copied
+    after them. A template whose fields overlap is encoded field by field in its order,
+    then a later field overwrites an earlier one like in snap7.util.
+    """
+
+    def __init__(self, fields, size):
+        """
+        Encoder constructor
+        :param fields: list contains tuples (data_type, byte, bit), in the order of the template
+        :param size: int
+        :raise ValueError
+        """
+        encoders = []
+        spans = []
+
+        for index, (data_type, byte, bit) in enumerate(fields):
+            codec = CODECS[data_type]
+            # a string needs its two header bytes, its characters are checked when it is encoded
+            width = 2 if data_type == 'String' else codec.size
+            if byte < 0 or byte + width > size:
+                raise ValueError("offset error")
+
+            encoders.append((codec.encode, byte, bit))
+            spans.append((byte, byte + width, index, data_type, bit))
+
+        spans.sort()
+        self.__size = size
+        self.__fields = tuple(encoders)
+        self.__patchable = not self.__overlaps(spans)
+        self.__numbers = None
+        self.__numbers_at = 0
+        self.__casts = ()
+        self.__bools = ()
+        self.__strings = ()
+        self.__rooms = {}
+
+        if self.__patchable:
+            self.__compile(spans)
+
+    @staticmethod
+    def __overlaps(spans):
+        """
+        whether two fields share a byte, Bools may share a byte with each other
+        :param spans: list contains tuples (start, end, index, data_type, bit), sorted
+        :return Boolean
+        """
+        end, bits, shared = 0, set(), None
+
+        for start, stop, _, data_type, bit in spans:
+            if data_type == 'Bool' and start == shared:
+                if bit in bits:
+                    return True
+                bits.add(bit)
+                continue
+
+            if start < end:
+                return True
+            shared, bits = (start, {bit}) if data_type == 'Bool' else (None, set())
+            end = stop
+
+        return False
+
+    def __compile(self, spans):
+        """
+        build the struct format of the numbers, the masks of the Bools and the room of the Strings
+        :param spans: list contains tuples (start, end, index, data_type, bit), sorted
+        :return:
+        """
+        formats = {'Int': ('h', int), 'Real': ('f', float)}
+        text, casts, bools, strings = ['>'], [], [], []
+        position = None
+
+        for number, (start, stop, index, data_type, bit) in enumerate(spans):
+            if data_type == 'Bool':
+                bools.append((index, start, 1 << bit))
+            elif data_type == 'String':
+                # the characters must end before the next field, else the fields are encoded in order
+                room = (spans[number + 1][0] if number + 1 < len(spans) else self.__size) - start - 2
+                strings.append((index, start, room))
+            else:
+                if position is None:
+                    position = self.__numbers_at = start
+                if start > position:
+                    text.append('{}x'.format(start - position))
+                text.append(formats[data_type][0])
+                casts.append((index, formats[data_type][1]))
+                position = stop
+
+        if casts:
+            self.__numbers = Struct(''.join(text))
+        self.__casts = tuple(casts)
+        self.__bools = tuple(bools)
+        self.__strings = tuple(strings)
+        self.__rooms = {index: room for index, _, room in strings}
+
+    def encode(self, values):
+        """
+        Create the image of the values
+        :param values: list, a value of every field in the order of the template
+        :return bytearray
+        :raises
+            ValueError
+            struct.error
+        """
+        holder = bytearray(self.__size)
+
+        if not self.__patchable:
+            return self.__encode_in_order(holder, values)
+
+        for index, byte, room in self.__strings:
+            value = values[index]
+            if isinstance(value, str) and len(value) > room:
+                return self.__encode_in_order(holder, values)
+
+        if self.__numbers is not None:
+            self.__numbers.pack_into(holder, self.__numbers_at, *[cast(values[foo]) for foo, cast in self.__casts])
+
+        for index, byte, mask in self.__bools:
+            value = values[index]
+            if value not in (0, 1):
+                raise ValueError("bool error")
+            if value:
+                holder[byte] |= mask
+
+        for index, byte, _ in self.__strings:
+            _encode_string(holder, byte, 0, values[index])
+
+        return holder
+
+    def __encode_in_order(self, holder, values):
+        for (encode, byte, bit), value in zip(self.__fields, values):
+            encode(holder, byte, bit, value)
+        return holder
+
+    def fits(self, changes):
+        """
+        whether the changes can be encoded into an existing image, a String which is longer
+        than the room before the next field cannot, the whole image is encoded then
+        :param changes: dict {index: value}
+        :return Boolean
+        """
+        if not self.__patchable:
+            return False
+
+        rooms = self.__rooms
+        return all(not isinstance(value, str) or len(value) <= rooms.get(index, len(value))
+                   for index, value in changes.items())
+
+    def encode_into(self, _bytearray, changes):
+        """
+        Encode only some fields into an existing image, the other bytes are not touched
+        :param _bytearray: bytearray, its size is the size of the template
+        :param changes: dict {index: value}
+        :return:
+        :raises
+            ValueError
+            struct.error
+        """
+        if not self.fits(changes):
+            raise ValueError("changes do not fit into the image")
+
+        fields = self.__fields
+        for index, value in changes.items():
+            encode, byte, bit = fields[index]
+            (_patch_string if encode is _encode_string else encode)(_bytearray, byte, bit, value)
+
+    @property
+    def patchable(self):
+        """
+        return whether fields can be encoded into an existing image
+        :return: Boolean
+        """
+        return self.__patchable
+
+
+class Layout:
+    """Compiled decode plan of a datablock template"""
+
+    def __init__(self, template, size):
+        """
+        Layout constructor. The template is interpreted only once here.
+        :param template: list contains dicts, sorted by offset
+        :param size: int
+        :raise ValueError
+        """
+        plan = []
+        filters = {}
+        fields = []
+        signature = [size]
+        fields_at = [[] for _ in range(size)]
+
+        for index, foo in enumerate(template):
+            try:
+                codec = CODECS[foo['Data_type']]
+            except KeyError:
+                raise ValueError("data_type error")
+
+            byte, bit = split_offset(codec.data_type, foo['Offset'])
+            plan.append((index, byte, bit, codec.decode))
+            fields.append((codec.data_type, byte, bit))
+            tag_filter = TagFilter.from_entry(codec.data_type, foo)
+            if tag_filter is not None:
+                filters[index] = tag_filter
+            signature.append((codec.data_type, byte, bit))
+
+            for position in range(*self.__span(codec, byte, size)):
+                fields_at[position].append(index)
+
+        self.__size = size
+        self.__plan = tuple(plan)
+        self.__filters = filters
+        # a digest and not hash(), templates which collide would skip the size check of the verifier
+        self.__signature = sha256(repr(tuple(signature)).encode()).hexdigest()
+        self.__fields_at = tuple(tuple(foo) for foo in fields_at)
+        self.__fields = tuple(fields)
+        self.__encoder = Encoder(fields, size)
+
+    @staticmethod
+    def __span(codec, byte, size):
+        """
+        Bytes which a field's decoded value depends on
+        :return tuple (start, end)
+        """
+        if codec.data_type == 'String':
+            # the first byte of a string is its max length, it is not a part of the value
+            return min(byte + 1, size), min(byte + codec.size, size)
+
+        return min(byte, size), min(byte + codec.size, size)
+
+    def fields_in(self, ranges):
+        """
+        Indexes of the fields which overlap the byte ranges
+        :param ranges: list contains tuples (start, end)
+        :return list contains int, sorted
+        """
+        fields = set()
+
+        for start, end in ranges:
+            for foo in self.__fields_at[start:end]:
+                fields.update(foo)
+
+        return sorted(fields)
+
+    def changes(self, old, new):
+        """
+        Decode the fields whose value differs between two images.
+        Only the fields overlapping a changed byte range are decoded.
+        :param old: bytes or bytearray
+        :param new: bytes or bytearray
+        :return dict {index: value}
+        """
+        holder = {}
+        plan = self.__plan
+
+        for index in self.fields_in(changed_ranges(old, new)):
+            _, byte, bit, decode = plan[index]
+            row = decode(new, byte, bit)
+            if decode(old, byte, bit) != row:
+                holder[index] = row
+
+        return holder
+
+    @property
+    def size(self):
+        """
+        return datablock size
+        :return: int
+        """
+        return self.__size
+
+    @property
+    def signature(self):
+        """
+        return the sha256 digest of the size and the fields, equal templates have equal signatures
+        :return: str
+        """
+        return self.__signature
+
+    @property
+    def filters(self):
+        """
+        return the filters of the fields which have a deadband or a minimum interval
+        :return: dict {index: TagFilter}
+        """
+        return self.__filters
+
+    @property
+    def fields(self):
+        """
+        return the data type, the byte and the bit of every field
+        :return: tuple contains (data_type, byte, bit)
+        """
+        return self.__fields
+
+    @property
+    def encoder(self):
+        """
+        return the encoder of the template
+        :return: Encoder
+        """
+        return self.__encoder
+
+    @property
+    def plan(self):
+        """
+        return the decode plan
+        :return: tuple contains (index, byte, bit, decode)
+        """
+        return self.__plan
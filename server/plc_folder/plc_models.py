@@ -1,5 +1,7 @@
-from plc_folder.plc_util import create_bytearray
-from snap7.util import get_bool, get_string, get_int, get_real
+from plc_folder.plc_layout import Layout
+from plc_folder.plc_numpy import vector_decoder
+from copy import copy
+from time import monotonic
 
 
 class Datablock:
@@ -10,17 +12,104 @@ class Datablock:
         Datablock contructor.
         :param inside the kwargs, _name: datablock's name
         :param kwargs : other information.
-        __template: list contains dicts
+            previous: Datablock or None, the same datablock of the last version
+            touched: set or None, indexes in data whose Value changed since previous,
+                only they are encoded into the image of previous, None encodes every field
         __datablock_number: int
         __size: int
-        __datablock: bytearray
+        __datablock: bytes, it is immutable so snapshots can share it
+        __layout: Layout
+        __vector: plc_numpy.VectorDecoder or None, the vectorized engine of wide templates
+        __positions: list, the layout index of every field in data
+        __published: dict {index: value}, last uploaded values of the filtered fields
+        __published_at: dict {index: float}, monotonic times of the last uploads
+        __held: set, filtered fields which changed but waited for their minimum interval
+        :raises
+            TypeError
+            ValueError
         """
-
-        self.__template = sorted(kwargs['data'], key=lambda x: x['Offset'])
+        data = kwargs['data']
+        if not isinstance(data, list):
+            raise TypeError("data must be list")
 
         self.__datablock_number = int(kwargs['_name'][2:])
         self.__size = int(kwargs['size'])
-        self.__datablock = create_bytearray(size=self.__size, lst=kwargs['data'])
+
+        previous = kwargs.get('previous')
+        image = self.__patch(previous, kwargs.get('touched'), data)
+        if image is None:
+            order = sorted(range(len(data)), key=lambda x: data[x]['Offset'])
+            template = [data[foo] for foo in order]
+            self.__layout = Layout(template, self.__size)
+            self.__positions = [0] * len(order)
+            for index, foo in enumerate(order):
+                self.__positions[foo] = index
+            image = self.__layout.encoder.encode([foo['Value'] for foo in template])
+            self.__vector = vector_decoder(self.__layout.fields, self.__size)
+
+        self.__published = {}
+        self.__published_at = {}
+        self.__held = set()
+        if self.__layout.filters and previous is not None and previous.__size == self.__size and \
+                previous.__layout.signature == self.__layout.signature:
+            image = self.__keep_filtered(previous, data, image)
+
+        self.__datablock = bytes(image)
+        for foo in self.__layout.filters:
+            if foo not in self.__published:
+                self.__published[foo] = self.__decode(self.__datablock, foo)
+
+    def __patch(self, previous, touched, data):
+        """
+        Encode only the touched fields into the image of previous, the plc values
+        of the other fields are kept. The layout of previous is reused.
+        :return bytearray or None when the datablock must be encoded whole
+        """
+        if previous is None or touched is None or previous.__size != self.__size or \
+                len(previous.__positions) != len(data) or not all(0 <= foo < len(data) for foo in touched):
+            return None
+
+        changes = {previous.__positions[foo]: data[foo]['Value'] for foo in touched}
+        if not previous.__layout.encoder.fits(changes):
+            return None
+
+        image = bytearray(previous.__datablock)
+        previous.__layout.encoder.encode_into(image, changes)
+        self.__layout = previous.__layout
+        self.__vector = previous.__vector
+        self.__positions = previous.__positions
+        return image
+
+    def __keep_filtered(self, previous, data, image):
+        """
+        The database shows the published values of the filtered fields, not the plc values.
+        A filtered field which the operator did not change keeps the value of the last plc
+        image, so a rebuild does not write a stale published value back to the plc.
+        :param previous: Datablock, the same datablock of the last version, its template is same
+        :param data: list, the fields of the database
+        :param image: bytearray, the image of data
+        :return bytearray
+        """
+        image = bytearray(image)
+        layout_data = {bar: foo for foo, bar in enumerate(self.__positions)}
+        kept = {}
+
+        for index in self.__layout.filters:
+            if index not in previous.__published:
+                continue
+
+            row = data[layout_data[index]]['Value']
+            if row == previous.__published[index]:
+                kept[index] = previous.__decode(previous.__datablock, index)
+                self.__published[index] = previous.__published[index]
+                if index in previous.__published_at:
+                    self.__published_at[index] = previous.__published_at[index]
+                if index in previous.__held:
+                    self.__held.add(index)
+
+        if kept:
+            self.__layout.encoder.encode_into(image, kept)
+        return image
 
     def create_data_for_fb(self, _bytearray):
         """
@@ -39,44 +128,70 @@ class Datablock:
         if self.__size != len(_bytearray):
             raise OverflowError("Bytearray is not correct")
 
-        holder = {}
-
-        for index, foo in enumerate(self.__template):
-            data_type = foo['Data_type']
-            offset = float(foo['Offset'])
-            row = None
-            old = None
-
-            if data_type == 'Bool':
-                byte, bit = str(offset).split('.')
-                byte, bit = int(byte), int(bit)
-                old = get_bool(self.__datablock, byte, bit)
-                row = get_bool(_bytearray, byte, bit)
-
-            elif data_type == 'String':
-                offset = int(offset)
-                old = get_string(self.__datablock, offset, 256)
-                row = get_string(_bytearray, offset, 256)
-
-            elif data_type == 'Int':
-                offset = int(offset)
-                old = get_int(self.__datablock, offset)
-                row = get_int(_bytearray, offset)
-
-            elif data_type == 'Real':
-                offset = int(offset)
-                old = get_real(self.__datablock, offset)
-                row = get_real(_bytearray, offset)
-            else:
-                raise ValueError("data_type error")
+        if self.__vector is not None:
+            holder = self.__vector.changes(self.__datablock, _bytearray)
+        else:
+            holder = self.__layout.changes(self.__datablock, _bytearray)
+        if self.__layout.filters:
+            holder = self.__publishable(holder, _bytearray)
+
+        self.__datablock = bytes(_bytearray)
+        return 'current/datablocks/DB{_num}/data'.format(_num=self.__datablock_number), holder
+
+    def __decode(self, _bytearray, index):
+        """
+        decode a field of an image
+        :return: value
+        """
+        _, byte, bit, decode = self.__layout.plan[index]
+        return decode(_bytearray, byte, bit)
+
+    def __publishable(self, holder, _bytearray):
+        """
+        Drop the changes which are in their deadband or before their minimum interval.
+        A change which waits for its interval is checked again in later cycles,
+        even if the plc does not change it anymore.
+        :param holder: dict {index: value}, the changes of the image
+        :param _bytearray: bytearray, the new image
+        :return dict {index: value}
+        """
+        filters = self.__layout.filters
+        now = monotonic()
+
+        for foo in self.__held:
+            if foo not in holder:
+                holder[foo] = self.__decode(_bytearray, foo)
+
+        for index, row in list(holder.items()):
+            tag_filter = filters.get(index)
+            if tag_filter is None:
+                continue
 
-            if old == row:
+            if not tag_filter.exceeds(self.__published[index], row):
+                self.__held.discard(index)
+                del holder[index]
                 continue
 
-            holder[index] = row
+            last = self.__published_at.get(index)
+            if last is not None and now - last < tag_filter.min_interval:
+                self.__held.add(index)
+                del holder[index]
+                continue
 
-        self.__datablock = _bytearray
-        return 'current/datablocks/DB{_num}/data'.format(_num=self.__datablock_number), holder
+            self.__held.discard(index)
+            self.__published[index] = row
+            self.__published_at[index] = now
+
+        return holder
+
+    @property
+    def has_held(self):
+        """
+        return whether filtered changes wait for their minimum interval,
+        then the datablock is checked even if the plc did not change it
+        :return: Boolean
+        """
+        return bool(self.__held)
 
     @property
     def datablock_number(self):
@@ -95,15 +210,37 @@ class Datablock:
 
         return self.__size
 
+    @property
+    def signature(self):
+        """
+        return the signature of the template
+        :return: str
+        """
+
+        return self.__layout.signature
+
     @property
     def datablock(self):
         """
         return __datablock
-        :return: list
+        :return: bytes
         """
 
         return self.__datablock
 
+    def snapshot(self):
+        """
+        return a datablock which shares the template, the layout and the image
+        :return: Datablock
+        """
+
+        holder = copy(self)
+        if self.__layout.filters:
+            holder.__published = dict(self.__published)
+            holder.__published_at = dict(self.__published_at)
+            holder.__held = set(self.__held)
+        return holder
+
 
 class Version_Model:
     """Version model for datum on database"""
@@ -112,6 +249,9 @@ class Version_Model:
         """
         __version_model contructor.
         :param kwargs:
+            previous: Version_Model, its datablocks are reused if they are not in changed
+            changed: dict {datablock name: set of changed fields or None} or None, None builds every datablock,
+                the filtered fields are built from the plc image of previous
 
         :raises
             ValueError
@@ -121,8 +261,21 @@ class Version_Model:
 
         self.__plc_information = kwargs['plc_informations']
 
+        reusable = {}
+        changed = kwargs.get('changed')
+        if kwargs.get('previous') is not None:
+            reusable = {foo.datablock_number: foo for foo in kwargs['previous'].datablocks}
+
         for foo in kwargs['datablocks']['data_block_names']:
-            self.__datablocks.append(Datablock(_name=foo, **kwargs['datablocks'][foo]))
+            if int(foo[2:]) in reusable and changed is not None and foo not in changed:
+                self.__datablocks.append(reusable[int(foo[2:])].snapshot())
+            elif int(foo[2:]) in reusable:
+                # a full rebuild keeps the plc values of the filtered fields
+                self.__datablocks.append(Datablock(_name=foo, previous=reusable[int(foo[2:])],
+                                                   touched=changed[foo] if changed is not None else None,
+                                                   **kwargs['datablocks'][foo]))
+            else:
+                self.__datablocks.append(Datablock(_name=foo, **kwargs['datablocks'][foo]))
 
         self.__datablocks.sort(key=lambda x: x.datablock_number)
         if not self.__datablocks:
@@ -158,3 +311,15 @@ class Version_Model:
     def name(self, _name):
         """set the __version"""
         self.__version = _name
+
+    def snapshot(self, _name):
+        """
+        return a version model which shares everything but its datablock objects,
+        so nothing is copied and later changes of one do not affect the other
+        :param _name: str
+        :return: Version_Model
+        """
+        holder = copy(self)
+        holder.__datablocks = [foo.snapshot() for foo in self.__datablocks]
+        holder.__version = _name
+        return holder
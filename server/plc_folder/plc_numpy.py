@@ -0,0 +1,144 @@
+"""
+Optional vectorized engine of Layout.changes, it is used when numpy is installed.
+
+The Int and Real fields of a template are grouped by type. Evenly spaced fields,
+for example an array of Reals, are viewed zero-copy as one strided big-endian array,
+the others are gathered with a precomputed index array. Bools are compared through
+their bytes and masks, Strings are compared and decoded in Python.
+"""
+from plc_folder.plc_layout import CODECS
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# numeric and bool fields below it are decoded faster in Python
+MIN_FIELDS = 256
+
+_NUMBERS = {'Int': ('>i2', '>u2', 2), 'Real': ('>f4', '>u4', 4)}
+
+
+def available():
+    """
+    return whether numpy is installed
+    :return: Boolean
+    """
+    return numpy is not None
+
+
+def _views(byte_offsets, value_type, raw_type, width):
+    """
+    return a function which views an image as the values and the raw integers of the fields
+    :param byte_offsets: list contains int, sorted
+    :return function (image, bytes) -> (values, raws)
+    """
+    count = len(byte_offsets)
+    stride = byte_offsets[1] - byte_offsets[0] if count > 1 else width
+
+    if stride >= width and all(bar - foo == stride for foo, bar in zip(byte_offsets, byte_offsets[1:])):
+        start = byte_offsets[0]
+
+        def strided(image, _):
+            values = numpy.ndarray((count,), value_type, buffer=image, offset=start, strides=(stride,))
+            raws = numpy.ndarray((count,), raw_type, buffer=image, offset=start, strides=(stride,))
+            return values, raws
+
+        return strided
+
+    gather = (numpy.array(byte_offsets, dtype=numpy.intp)[:, None] + numpy.arange(width)).ravel()
+
+    def gathered(_, image_bytes):
+        holder = image_bytes[gather]
+        return holder.view(value_type), holder.view(raw_type)
+
+    return gathered
+
+
+class VectorDecoder:
+    """Vectorized compare and decode of a datablock template"""
+
+    def __init__(self, fields, size):
+        """
+        VectorDecoder constructor
+        :param fields: list contains tuples (data_type, byte, bit), in the order of the layout
+        :param size: int
+        :raise RuntimeError, numpy is not installed
+        """
+        if numpy is None:
+            raise RuntimeError("numpy is not installed")
+
+        groups = {}
+        bools = []
+        strings = []
+
+        for index, (data_type, byte, bit) in enumerate(fields):
+            if data_type in _NUMBERS:
+                groups.setdefault(data_type, []).append((byte, index))
+            elif data_type == 'Bool':
+                bools.append((byte, bit, index))
+            else:
+                strings.append((index, byte, min(byte + 1, size), min(byte + CODECS['String'].size, size)))
+
+        self.__numbers = []
+        for data_type, members in groups.items():
+            members.sort()
+            value_type, raw_type, width = _NUMBERS[data_type]
+            view = _views([foo for foo, _ in members], value_type, raw_type, width)
+            self.__numbers.append((numpy.array([bar for _, bar in members]), view))
+
+        bools.sort()
+        self.__bool_bytes = numpy.array([foo for foo, _, _ in bools], dtype=numpy.intp)
+        self.__bool_masks = numpy.array([1 << bar for _, bar, _ in bools], dtype=numpy.uint8)
+        self.__bool_indexes = numpy.array([foo for _, _, foo in bools])
+        self.__strings = tuple(strings)
+        self.__decode_string = CODECS['String'].decode
+
+    def changes(self, old, new):
+        """
+        Decode the fields whose value differs between two images, like Layout.changes
+        :param old: bytes or bytearray
+        :param new: bytes or bytearray
+        :return dict {index: value}, sorted by index
+        """
+        old_bytes = numpy.frombuffer(old, numpy.uint8)
+        new_bytes = numpy.frombuffer(new, numpy.uint8)
+        found = []
+
+        for indexes, view in self.__numbers:
+            old_values, old_raws = view(old, old_bytes)
+            new_values, new_raws = view(new, new_bytes)
+            # equal bytes are not decoded by Layout, so an unchanged NaN is not a change
+            changed = numpy.flatnonzero((old_raws != new_raws) & (old_values != new_values))
+            if changed.size:
+                found.extend(zip(indexes[changed].tolist(), new_values[changed].tolist()))
+
+        if self.__bool_indexes.size:
+            old_bits = old_bytes[self.__bool_bytes] & self.__bool_masks
+            new_bits = new_bytes[self.__bool_bytes] & self.__bool_masks
+            changed = numpy.flatnonzero(old_bits != new_bits)
+            if changed.size:
+                found.extend(zip(self.__bool_indexes[changed].tolist(), (new_bits[changed] != 0).tolist()))
+
+        for index, byte, start, end in self.__strings:
+            if old[start:end] != new[start:end]:
+                row = self.__decode_string(new, byte, 0)
+                if self.__decode_string(old, byte, 0) != row:
+                    found.append((index, row))
+
+        found.sort()
+        return dict(found)
+
+
+def vector_decoder(fields, size):
+    """
+    return the vectorized engine of a template or None, when numpy is not installed
+    or the template has too few numeric and bool fields to gain from it
+    :param fields: list contains tuples (data_type, byte, bit)
+    :param size: int
+    :return VectorDecoder or None
+    """
+    if numpy is None or sum(foo != 'String' for foo, _, _ in fields) < MIN_FIELDS:
+        return None
+
+    return VectorDecoder(fields, size)
@@ -0,0 +1,273 @@
+from ctypes import POINTER, byref, c_int32, c_uint8, cast
+from snap7 import snap7types, snap7exceptions
+from snap7.common import check_error
+import logging
+
+MAX_VARS = 20
+READ_REQUEST_HEADER = 19
+READ_REQUEST_ITEM = 12
+READ_RESPONSE_HEADER = 18
+READ_RESPONSE_ITEM = 4
+WRITE_REQUEST_HEADER = 35
+WRITE_REQUEST_ITEM = 16
+# two ranges closer than an item's overhead are cheaper to transfer as one
+COALESCE_GAP = WRITE_REQUEST_ITEM
+
+
+def _padded(size):
+    """
+    data of an item is padded to even in s7 telegrams
+    :param size: int
+    :return int
+    """
+    return size + (size & 1)
+
+
+def split(db_number, start, size, chunk_size):
+    """
+    Split a range into pieces of at most chunk_size bytes
+    :param db_number: int
+    :param start: int
+    :param size: int
+    :param chunk_size: int
+    :return list contains tuples (db_number, start, size)
+    """
+    return [(db_number, begin, min(chunk_size, start + size - begin))
+            for begin in range(start, start + size, chunk_size)]
+
+
+def coalesce(ranges, gap=COALESCE_GAP):
+    """
+    Merge ranges of a datablock which are adjacent or closer than gap bytes
+    :param ranges: list contains tuples (db_number, start, size)
+    :param gap: int
+    :return list contains tuples (db_number, start, size), sorted
+    """
+    holder = []
+
+    for db_number, start, size in sorted(ranges):
+        if holder and holder[-1][0] == db_number and start <= holder[-1][1] + holder[-1][2] + gap:
+            last_db, last_start, last_size = holder[-1]
+            holder[-1] = (last_db, last_start, max(last_start + last_size, start + size) - last_start)
+        else:
+            holder.append((db_number, start, size))
+
+    return holder
+
+
+def plan_reads(areas, pdu_length):
+    """
+    Split areas into pdu sized pieces and group them into multi-variable read requests
+    :param areas: list contains tuples (db_number, size)
+    :param pdu_length: int, negotiated pdu length
+    :return list contains lists of (db_number, start, size)
+    """
+    chunk_size = pdu_length - READ_RESPONSE_HEADER - READ_RESPONSE_ITEM
+    chunk_size -= chunk_size & 1
+    groups = []
+    group = []
+    response = READ_RESPONSE_HEADER
+
+    for db_number, size in areas:
+        for piece in split(db_number, 0, size, chunk_size):
+            item = READ_RESPONSE_ITEM + _padded(piece[2])
+
+            if group and (len(group) == MAX_VARS or response + item > pdu_length or
+                          READ_REQUEST_HEADER + READ_REQUEST_ITEM * (len(group) + 1) > pdu_length):
+                groups.append(group)
+                group = []
+                response = READ_RESPONSE_HEADER
+
+            group.append(piece)
+            response += item
+
+    if group:
+        groups.append(group)
+
+    return groups
+
+
+def plan_writes(ranges, pdu_length, gap=COALESCE_GAP):
+    """
+    Coalesce ranges, split them into pdu sized pieces and group them into multi-variable write requests
+    :param ranges: list contains tuples (db_number, start, size)
+    :param pdu_length: int, negotiated pdu length
+    :param gap: int, ranges closer than gap bytes are merged
+    :return list contains lists of (db_number, start, size)
+    """
+    chunk_size = pdu_length - WRITE_REQUEST_HEADER
+    chunk_size -= chunk_size & 1
+    groups = []
+    group = []
+    request = WRITE_REQUEST_HEADER
+
+    for db_number, start, size in coalesce(ranges, gap=gap):
+        for piece in split(db_number, start, size, chunk_size):
+            item = WRITE_REQUEST_ITEM + _padded(piece[2])
+
+            if group and (len(group) == MAX_VARS or request + item > pdu_length):
+                groups.append(group)
+                group = []
+                request = WRITE_REQUEST_HEADER
+
+            group.append(piece)
+            request += item
+
+    if group:
+        groups.append(group)
+
+    return groups
+
+
+def _data_items(group):
+    """
+    Create S7DataItems and their buffers for a group of pieces
+    :param group: list contains tuples (db_number, start, size)
+    :return tuple (items, buffers)
+    """
+    items = (snap7types.S7DataItem * len(group))()
+    buffers = []
+
+    for item, (db_number, start, size) in zip(items, group):
+        buffer = (c_uint8 * size)()
+        item.Area = snap7types.S7AreaDB
+        item.WordLen = snap7types.S7WLByte
+        item.Result = 0
+        item.DBNumber = db_number
+        item.Start = start
+        item.Amount = size
+        item.pData = cast(buffer, POINTER(c_uint8))
+        buffers.append(buffer)
+
+    return items, buffers
+
+
+def _write_multi(client, group, images):
+    """
+    Write a group in one request, an item which the plc refuses is written alone
+    :param client: connected snap7 client
+    :param group: list contains tuples (db_number, start, size)
+    :param images: dict {db_number: bytes}
+    :return:
+    :raise snap7exceptions.Snap7Exception
+    """
+    items, buffers = _data_items(group)
+
+    for buffer, (db_number, start, size) in zip(buffers, group):
+        memoryview(buffer).cast('B')[:] = memoryview(images[db_number])[start:start + size]
+
+    check_error(client.library.Cli_WriteMultiVars(client.pointer, byref(items), c_int32(len(items))),
+                context="client")
+
+    for item, (db_number, start, size) in zip(items, group):
+        if item.Result:
+            client.db_write(db_number, start, memoryview(images[db_number])[start:start + size])
+
+
+def write_ranges(client, images, ranges, gap=0):
+    """
+    Write ranges of datablock images in pdu sized multi-variable requests.
+    gap is 0 by default, so bytes which did not change are not written over
+    values which the plc program may have changed meanwhile.
+    :param client: connected snap7 client
+    :param images: dict {db_number: bytes or bytearray}
+    :param ranges: list contains tuples (db_number, start, size)
+    :param gap: int
+    :return:
+    :raise snap7exceptions.Snap7Exception
+    """
+    for group in plan_writes(ranges, client.get_pdu_length(), gap=gap):
+        if len(group) > 1:
+            try:
+                _write_multi(client, group, images)
+                continue
+            except snap7exceptions.Snap7Exception as Error:
+                logging.warning("multi-variable write is rejected, single writes are used: {}".format(Error))
+
+        for db_number, start, size in group:
+            client.db_write(db_number, start, memoryview(images[db_number])[start:start + size])
+
+
+class TransferPlan:
+    """
+    Pdu aware read plan of a plc's datablocks. The plan is computed once per
+    negotiated pdu length and reused on every cycle. A snap7 client runs one job
+    at a time, so the requests of a plan are sent back to back.
+    """
+
+    def __init__(self, areas):
+        """
+        TransferPlan constructor
+        :param areas: list contains tuples (db_number, size)
+        """
+        self.__areas = list(areas)
+        self.__groups = None
+        self.__pdu_length = None
+        self.__multi = True
+
+    def __plan(self, client):
+        """
+        Return the read groups, they are planned again when the pdu length changes
+        :param client: connected snap7 client
+        :return list
+        """
+        pdu_length = client.get_pdu_length()
+        if pdu_length != self.__pdu_length:
+            self.__groups = plan_reads(self.__areas, pdu_length)
+            self.__pdu_length = pdu_length
+
+        return self.__groups
+
+    def read(self, client):
+        """
+        Read every area
+        :param client: connected snap7 client
+        :return dict {db_number: bytearray}
+        :raise snap7exceptions.Snap7Exception
+        """
+        holder = {db_number: bytearray(size) for db_number, size in self.__areas}
+
+        for group in self.__plan(client):
+            if len(group) == 1 or not self.__multi:
+                for db_number, start, size in group:
+                    holder[db_number][start:start + size] = client.db_read(db_number, start, size)
+                continue
+
+            try:
+                self.__read_multi(client, group, holder)
+            except snap7exceptions.Snap7Exception as Error:
+                for db_number, start, size in group:
+                    holder[db_number][start:start + size] = client.db_read(db_number, start, size)
+
+                # the single reads succeeded, so the plc rejects multi-variable requests
+                logging.warning("multi-variable read is rejected, single reads are used: {}".format(Error))
+                self.__multi = False
+
+        return holder
+
+    @staticmethod
+    def __read_multi(client, group, holder):
+        """
+        Read a group in one request, an item which the plc refuses is read alone
+        :param client: connected snap7 client
+        :param group: list contains tuples (db_number, start, size)
+        :param holder: dict {db_number: bytearray}, pieces are copied into it
+        :return:
+        :raise snap7exceptions.Snap7Exception
+        """
+        items, buffers = _data_items(group)
+        client.read_multi_vars(items)
+
+        for item, buffer, (db_number, start, size) in zip(items, buffers, group):
+            if item.Result:
+                holder[db_number][start:start + size] = client.db_read(db_number, start, size)
+            else:
+                holder[db_number][start:start + size] = buffer
+
+    @property
+    def areas(self):
+        """
+        return areas
+        :return: list contains tuples (db_number, size)
+        """
+        return self.__areas
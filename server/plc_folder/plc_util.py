@@ -1,5 +1,22 @@
+from functools import lru_cache
 from plc_folder import plc_exception
-from snap7.util import set_bool, set_int, set_real, set_string
+from plc_folder.plc_layout import CODECS, Encoder, split_offset
+
+
+@lru_cache(maxsize=64)
+def _compile(size, structure):
+    """
+    Compile the encoder of a template structure, templates which differ only in their values share it
+    :param size: int
+    :param structure: tuple contains tuples (data_type, offset) in the order of the list
+    :return tuple (order, Encoder), order is the index of every field sorted by offset
+    :raise plc_exception.DatabaseError
+    """
+    if any(foo not in CODECS for foo, _ in structure):
+        raise plc_exception.DatabaseError("Data is not correct.")
+
+    order = sorted(range(len(structure)), key=lambda x: structure[x][1])
+    return order, Encoder([(structure[foo][0],) + split_offset(*structure[foo]) for foo in order], size)
 
 
 def create_bytearray(size, lst):
@@ -10,32 +27,11 @@ def create_bytearray(size, lst):
         :return holder: bytearray
         :raises
             TypeError
+            ValueError
             plc_exception.DatabaseError
         """
     if not isinstance(lst, list):
         raise TypeError("create_bytearray takes list.")
 
-    lst = sorted(lst, key=lambda x: x['Offset'])
-    holder = bytearray([0 for _ in range(size)])
-
-    for foo in lst:
-        _offset = foo["Offset"]
-        _value = foo["Value"]
-        if foo['Data_type'] == 'Bool':
-            byte, bit = str(float(_offset)).split('.')
-            byte, bit = int(byte), int(bit)
-
-            set_bool(holder, byte, bit, _value)
-
-        elif foo['Data_type'] == 'String':
-            set_string(holder, int(_offset), _value, 256)
-
-        elif foo['Data_type'] == 'Int':
-            set_int(holder, int(_offset), _value)
-
-        elif foo['Data_type'] == 'Real':
-            set_real(holder, int(_offset), _value)
-        else:
-            raise plc_exception.DatabaseError("Data is not correct.")
-
-    return holder
+    order, encoder = _compile(size, tuple((foo['Data_type'], foo['Offset']) for foo in lst))
+    return encoder.encode([lst[foo]['Value'] for foo in order])
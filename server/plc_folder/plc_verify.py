@@ -0,0 +1,97 @@
+from threading import Lock
+from snap7 import snap7exceptions
+from plc_folder import plc_exception
+import logging
+
+# errors of get_block_info which mean that the cpu does not give block info at all,
+# the other errors, for example a missing or protected datablock, are only about one datablock
+UNSUPPORTED_ERRORS = ('function not available', 'function refused')
+
+
+class LayoutVerifier:
+    """
+    Verifies that datablocks on a cpu have the sizes of their templates.
+    A verified (cpu, db number, template signature) is cached until the
+    session reconnects or the entry is invalidated.
+    """
+
+    def __init__(self):
+        """
+        LayoutVerifier constructor
+        """
+        self.__verified = {}
+        self.__block_info = {}
+        self.__lock = Lock()
+
+    def verify(self, session, _client, datablocks):
+        """
+        Verify the sizes of datablocks
+        :param session: Session of the cpu
+        :param _client: leased snap7 client of the session
+        :param datablocks: list contains Datablock
+        :return:
+        :raise plc_exception.DatablockSizeError
+        """
+        for foo in datablocks:
+            key = (session.parameters, foo.datablock_number, foo.signature)
+
+            with self.__lock:
+                if self.__verified.get(key) == session.generation:
+                    continue
+
+            self.__check(session, _client, foo.datablock_number, foo.size)
+
+            with self.__lock:
+                self.__verified[key] = session.generation
+
+    def invalidate(self, parameters, db_number=None):
+        """
+        Forget the verified datablocks of a cpu, for example after a program download
+        :param parameters: tuple (ip_address, rack, slot, port)
+        :param db_number: int or None, None forgets every datablock of the cpu
+        :return:
+        """
+        with self.__lock:
+            for key in list(self.__verified):
+                if key[0] == parameters and (db_number is None or key[1] == db_number):
+                    del self.__verified[key]
+
+            if db_number is None:
+                self.__block_info.pop(parameters, None)
+
+    def __check(self, session, _client, db_number, size):
+        """
+        Check a datablock size with block info, or with probe reads when the cpu does not give block info
+        :return:
+        :raise plc_exception.DatablockSizeError
+        """
+        if self.__block_info.get(session.parameters, True):
+            try:
+                info = _client.get_block_info('DB', db_number)
+            except snap7exceptions.Snap7Exception as Error:
+                if any(foo in str(Error).lower() for foo in UNSUPPORTED_ERRORS):
+                    logging.info("block info is not supported by {}, probe reads are used: {}".format(
+                        session.parameters, Error))
+                    self.__block_info[session.parameters] = False
+            else:
+                # the cpu rounds a datablock of an odd size up to an even size
+                if info.MC7Size < size:
+                    raise plc_exception.DatablockSizeError("Datablock size is smaller than a plc's size.")
+                if info.MC7Size > size + 1:
+                    raise plc_exception.DatablockSizeError("Datablock size is bigger than a plc's size. ")
+                return
+
+        try:
+            _client.db_read(db_number, 0, size)
+        except snap7exceptions.Snap7Exception:
+            raise plc_exception.DatablockSizeError("Datablock size is smaller than a plc's size.")
+
+        try:
+            _client.db_read(db_number, 0, size + 2)
+        except snap7exceptions.Snap7Exception:
+            return
+
+        raise plc_exception.DatablockSizeError("Datablock size is bigger than a plc's size. ")
+
+
+layout_verifier = LayoutVerifier()
@@ -0,0 +1,183 @@
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import logging
+
+from server_folder.server_scheduler import DEFAULT_INTERVAL, DEFAULT_WORKERS
+
+
+class AsyncRuntime:
+    """
+    asyncio runtime which polls plcs and handles listener events on one event loop.
+    It has the same add/remove/start/stop interface as PollScheduler. Blocking
+    snap7 and firebase calls run on a bounded executor, never on the loop.
+    """
+
+    def __init__(self, job, handler, loop, max_workers=DEFAULT_WORKERS):
+        """
+        AsyncRuntime constructor
+        :param job: function which takes a key and polls it
+        :param handler: function which takes a listener event
+        :param loop: running asyncio event loop
+        :param max_workers: int, the most polls running at the same time
+        :raise ValueError
+        """
+        if max_workers < 1:
+            raise ValueError("max_workers must be positive")
+
+        self.__job = job
+        self.__handler = handler
+        self.__loop = loop
+        # one more worker than polls, so listener events are never queued behind polls
+        self.__pool = ThreadPoolExecutor(max_workers=max_workers + 1)
+        self.__semaphore = asyncio.Semaphore(max_workers)
+        self.__events = asyncio.Queue()
+        self.__intervals = {}
+        self.__overruns = {}
+        self.__tasks = {}
+        self.__event_task = None
+        self.__active = False
+
+    def add(self, key, interval=DEFAULT_INTERVAL):
+        """
+        add a key or change its interval, thread safe
+        :param key: hashable
+        :param interval: float, seconds
+        :return:
+        :raise ValueError
+        """
+        if interval <= 0:
+            raise ValueError("interval must be positive")
+
+        self.__loop.call_soon_threadsafe(self.__add, key, interval)
+
+    def remove(self, key):
+        """
+        remove a key, thread safe
+        :param key: hashable
+        :return:
+        """
+        self.__loop.call_soon_threadsafe(self.__remove, key)
+
+    def submit_event(self, event):
+        """
+        queue a listener event, thread safe. Events are handled in arrival order.
+        :param event:
+        :return:
+        """
+        self.__loop.call_soon_threadsafe(self.__events.put_nowait, event)
+
+    def start(self):
+        """
+        start polling and event handling, thread safe
+        :return:
+        """
+        self.__loop.call_soon_threadsafe(self.__start)
+
+    def stop(self):
+        """
+        stop every task and wait for them. It must not be called from the loop thread.
+        :return:
+        """
+        asyncio.run_coroutine_threadsafe(self.close(), self.__loop).result()
+
+    async def run_blocking(self, function, *args):
+        """
+        run a blocking function off the loop
+        :param function:
+        :param args:
+        :return: the result of the function
+        """
+        return await self.__loop.run_in_executor(None, function, *args)
+
+    async def close(self):
+        """
+        cancel every task and release the executor
+        :return:
+        """
+        if not self.__active:
+            return
+        self.__active = False
+
+        tasks = list(self.__tasks.values())
+        if self.__event_task is not None:
+            tasks.append(self.__event_task)
+        self.__tasks = {}
+        self.__event_task = None
+
+        for foo in tasks:
+            foo.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self.run_blocking(self.__pool.shutdown)
+
+    def __start(self):
+        if self.__active:
+            logging.warning("runtime is active")
+            return
+
+        self.__active = True
+        self.__event_task = self.__loop.create_task(self.__consume_events())
+        for key in self.__intervals:
+            self.__tasks[key] = self.__loop.create_task(self.__poll_forever(key))
+
+    def __add(self, key, interval):
+        self.__intervals[key] = interval
+        self.__overruns.setdefault(key, 0)
+        if self.__active and key not in self.__tasks:
+            self.__tasks[key] = self.__loop.create_task(self.__poll_forever(key))
+
+    def __remove(self, key):
+        self.__intervals.pop(key, None)
+        self.__overruns.pop(key, None)
+        task = self.__tasks.pop(key, None)
+        if task is not None:
+            task.cancel()
+
+    async def __poll_forever(self, key):
+        """
+        poll a key on its interval until it is removed
+        :return:
+        """
+        while key in self.__intervals:
+            interval = self.__intervals[key]
+
+            async with self.__semaphore:
+                started = self.__loop.time()
+                try:
+                    await self.__loop.run_in_executor(self.__pool, self.__job, key)
+                except Exception:
+                    logging.exception('poll of "{}" failed'.format(key))
+                elapsed = self.__loop.time() - started
+
+            if elapsed > interval and key in self.__overruns:
+                self.__overruns[key] += 1
+                logging.warning('poll of "{}" took {:.3f}s, interval is {:.3f}s'.format(key, elapsed, interval))
+
+            await asyncio.sleep(max(0.0, interval - elapsed))
+
+    async def __consume_events(self):
+        """
+        handle listener events one by one, each in the executor
+        :return:
+        """
+        while True:
+            event = await self.__events.get()
+            try:
+                await self.__loop.run_in_executor(self.__pool, self.__handler, event)
+            except Exception:
+                logging.exception("listener event failed")
+
+    @property
+    def overruns(self):
+        """
+        return how many times a poll took longer than its interval
+        :return: dict
+        """
+        return dict(self.__overruns)
+
+    @property
+    def is_active(self):
+        """
+        return whether the runtime runs
+        :return: Boolean
+        """
+        return self.__active
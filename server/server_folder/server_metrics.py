@@ -0,0 +1,297 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from bisect import bisect_left
+from math import inf
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+FIELD_BUCKETS = (0, 1, 5, 10, 50, 100, 500, 1000, 5000, 10000, 50000)
+DEFAULT_PORT = 9108
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = ['{}="{}"'.format(foo, _escape(bar)) for foo, bar in zip(names, values)]
+    pairs.extend('{}="{}"'.format(foo, _escape(bar)) for foo, bar in extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """
+    A metric family whose series are selected by label values. A metric can be
+    bound to a function, then its series are read from the function when it is rendered.
+    """
+
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        """
+        _Metric constructor
+        :param name: str
+        :param documentation: str
+        :param labels: tuple contains str
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._series = {}
+        self._lock = Lock()
+        self.__function = None
+
+    def bind(self, function):
+        """
+        read the series from a function
+        :param function: function or None, it returns a value or a dict {label values: value}
+        :return:
+        """
+        self.__function = function
+
+    def _key(self, values):
+        if len(values) != len(self.labels):
+            raise ValueError("{} takes the labels {}".format(self.name, self.labels))
+        return tuple(str(foo) for foo in values)
+
+    def remove(self, *values):
+        """
+        forget a series, for example of a deleted plc
+        :return:
+        """
+        with self._lock:
+            self._series.pop(self._key(values), None)
+
+    def samples(self):
+        """
+        return the lines of the series
+        :return list contains str
+        """
+        if self.__function is not None:
+            return self.__bound_samples()
+
+        with self._lock:
+            return ['{}{} {}'.format(self.name, _labels(self.labels, key), _number(value))
+                    for key, value in self._series.items()]
+
+    def __bound_samples(self):
+        try:
+            result = self.__function()
+        except Exception:
+            return []
+
+        if not isinstance(result, dict):
+            result = {(): result}
+
+        return ['{}{} {}'.format(self.name, _labels(self.labels, key if isinstance(key, tuple) else (key,)),
+                                 _number(value)) for key, value in result.items()]
+
+    def render(self):
+        lines = ['# HELP {} {}'.format(self.name, self.documentation), '# TYPE {} {}'.format(self.name, self.kind)]
+        lines.extend(self.samples())
+        return lines
+
+
+class Counter(_Metric):
+    """A value which only increases"""
+
+    kind = 'counter'
+
+    def inc(self, *values, amount=1):
+        """
+        increase the series of the label values
+        :return:
+        """
+        key = self._key(values)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """A value which goes up and down"""
+
+    kind = 'gauge'
+
+    def set(self, value, *values):
+        """
+        set the series of the label values
+        :return:
+        """
+        key = self._key(values)
+        with self._lock:
+            self._series[key] = value
+
+
+class Histogram(_Metric):
+    """Observations counted in cumulative buckets"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (inf,)
+
+    def observe(self, amount, *values):
+        """
+        add an observation to the series of the label values
+        :return:
+        """
+        key = self._key(values)
+        index = bisect_left(self.buckets, amount)
+
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            series[0][index] += 1
+            series[1] += amount
+            series[2] += 1
+
+    def samples(self):
+        lines = []
+
+        with self._lock:
+            for key, (counts, total, number) in self._series.items():
+                cumulative = 0
+                for bucket, foo in zip(self.buckets, counts):
+                    cumulative += foo
+                    lines.append('{}_bucket{} {}'.format(
+                        self.name, _labels(self.labels, key, (('le', _number(float(bucket))),)), cumulative))
+                lines.append('{}_sum{} {}'.format(self.name, _labels(self.labels, key), _number(total)))
+                lines.append('{}_count{} {}'.format(self.name, _labels(self.labels, key), number))
+
+        return lines
+
+
+class MetricsRegistry:
+    """Metrics of the server, they are rendered in the prometheus text format"""
+
+    def __init__(self):
+        """
+        MetricsRegistry constructor
+        """
+        self.__metrics = {}
+        self.__lock = Lock()
+
+    def __register(self, metric):
+        with self.__lock:
+            if metric.name in self.__metrics:
+                raise ValueError("{} is registered".format(metric.name))
+            self.__metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labels=()):
+        return self.__register(Counter(name, documentation, labels))
+
+    def gauge(self, name, documentation, labels=()):
+        return self.__register(Gauge(name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        return self.__register(Histogram(name, documentation, labels, buckets))
+
+    def unregister(self, name):
+        with self.__lock:
+            self.__metrics.pop(name, None)
+
+    def remove(self, **labels):
+        """
+        forget the series in every metric which has exactly these labels, for example plc_uid=...
+        :return:
+        """
+        with self.__lock:
+            metrics = list(self.__metrics.values())
+
+        for foo in metrics:
+            if set(foo.labels) == set(labels):
+                foo.remove(*(labels[bar] for bar in foo.labels))
+
+    def render(self):
+        """
+        return every metric in the prometheus text format
+        :return: str
+        """
+        with self.__lock:
+            metrics = list(self.__metrics.values())
+
+        lines = []
+        for foo in metrics:
+            lines.extend(foo.render())
+
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsServer:
+    """Serves a registry on http://host:port/metrics"""
+
+    def __init__(self, registry, port=DEFAULT_PORT, host='127.0.0.1'):
+        """
+        MetricsServer constructor
+        :param registry: MetricsRegistry
+        :param port: int
+        :param host: str
+        """
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.__http = ThreadingHTTPServer((host, port), Handler)
+        self.__http.daemon_threads = True
+        self.__thread = Thread(target=self.__http.serve_forever, name="metrics", daemon=True)
+        self.__thread.start()
+
+    def close(self):
+        self.__http.shutdown()
+        self.__http.server_close()
+
+    @property
+    def port(self):
+        return self.__http.server_address[1]
+
+
+metrics = MetricsRegistry()
+
+poll_seconds = metrics.histogram('plc_poll_seconds', "time of reading a plc and decoding its changes",
+                                 ('plc_uid',))
+update_seconds = metrics.histogram('plc_update_seconds', "time of writing database changes to a plc",
+                                   ('plc_uid',))
+fields_changed = metrics.histogram('plc_fields_changed', "fields which changed in a poll", ('plc_uid',),
+                                   buckets=FIELD_BUCKETS)
+poll_errors = metrics.counter('plc_poll_errors_total', "polls which raised", ('plc_uid',))
+poll_overruns = metrics.counter('plc_poll_overruns_total', "polls which took longer than their interval",
+                                ('plc_uid',))
+bytes_read = metrics.counter('plc_bytes_read_total', "bytes read from a plc", ('plc_uid',))
+bytes_written = metrics.counter('plc_bytes_written_total', "bytes written to a plc", ('plc_uid',))
+connection_state = metrics.gauge('plc_connection_state', "0 connected, 1 backing off, 2 open circuit, 3 released",
+                                 ('plc_uid',))
+reconnects = metrics.counter('plc_reconnects_total', "reconnects of the session of a plc", ('plc_uid',))
+upload_seconds = metrics.histogram('upload_seconds', "time of a multi-location update")
+upload_paths = metrics.counter('upload_paths_total', "paths which were uploaded")
+upload_errors = metrics.counter('upload_errors_total', "multi-location updates which failed")
+upload_rejected = metrics.counter('upload_rejected_total',
+                                  "maps which the database rejected, they are in the dead-letter file")
+upload_batch_depth = metrics.gauge('upload_batch_depth', "paths which wait for the upload window")
+upload_queue_depth = metrics.gauge('upload_queue_depth', "maps which wait in memory for an upload")
+upload_spilling = metrics.gauge('upload_spilling', "1 while uploads wait in the journal")
+startup_seconds = metrics.gauge('startup_seconds', "time of a startup phase", ('phase',))
+listener_seconds = metrics.histogram('listener_seconds', "time of handling a database event", ('event_type',))
@@ -0,0 +1,181 @@
+from copy import deepcopy
+from threading import Lock
+
+
+class PLCMirror:
+    """
+    Local copy of the plc nodes on the database. Listener events and the
+    server's own uploads are applied to it, so a plc is updated without
+    downloading its node again.
+    """
+
+    def __init__(self):
+        """
+        PLCMirror constructor
+        """
+        self.__nodes = {}
+        self.__lock = Lock()
+
+    def apply(self, event_type, path, data):
+        """
+        apply a listener event
+        :param event_type: str, put or patch
+        :param path: str, event.path
+        :param data: event.data
+        :return dict {plc_uid: changed}, changed is None for every datablock or a dict
+            {datablock name: fields}, fields is a set of the indexes whose Value changed or None for every field
+        """
+        base = [foo for foo in path.split('/') if foo]
+
+        if event_type.lower() == 'patch' and isinstance(data, dict):
+            items = [(base + [bar for bar in key.split('/') if bar], value) for key, value in data.items()]
+        else:
+            items = [(base, data)]
+
+        changes = {}
+
+        with self.__lock:
+            for parts, value in items:
+                # the mirror owns its nodes, the caller can hand the same data to the uploader
+                self.__set(parts, deepcopy(value))
+
+                if not parts:
+                    changes.update({foo: None for foo in self.__nodes})
+                    continue
+
+                changed = self.__changed(parts)
+                if parts[0] not in changes:
+                    changes[parts[0]] = changed
+                elif changes[parts[0]] is not None:
+                    changes[parts[0]] = None if changed is None else self.__merge(changes[parts[0]], changed)
+
+        return changes
+
+    def apply_update(self, payload):
+        """
+        apply a multi-location map which the server sends
+        :param payload: dict {path: value}
+        :return:
+        """
+        self.apply('patch', '/', payload)
+
+    def replace(self, plc_uid, node):
+        """
+        replace the node of a plc
+        :param plc_uid: str
+        :param node: dict or None
+        :return:
+        """
+        self.apply('put', '/' + plc_uid, node)
+
+    def snapshot(self, plc_uid, changed=None):
+        """
+        return a copy of a plc node which is safe to read while events are applied.
+        Only the changed datablocks are copied, the others are left out of current.
+        :param plc_uid: str
+        :param changed: datablock names or None for every datablock
+        :return dict or None
+        """
+        with self.__lock:
+            node = self.__nodes.get(plc_uid)
+            if not isinstance(node, dict):
+                return None
+            if changed is None:
+                return deepcopy(node)
+
+            holder = dict(node)
+            current = node.get('current')
+            if isinstance(current, dict) and isinstance(current.get('datablocks'), dict):
+                datablocks = current['datablocks']
+                holder['current'] = dict(current)
+                holder['current']['datablocks'] = {
+                    key: deepcopy(value) for key, value in datablocks.items()
+                    if key in changed or key == 'data_block_names'}
+
+            return holder
+
+    @staticmethod
+    def __changed(parts):
+        """
+        datablocks and fields which a change at the path affects
+        :param parts: list contains str, the first one is plc_uid
+        :return dict {datablock name: set of field indexes or None} or None
+        """
+        if len(parts) == 1:
+            return None
+        if parts[1] != 'current':
+            return {}
+        if len(parts) == 2:
+            return None
+        if parts[2] != 'datablocks':
+            return {}
+        if len(parts) == 3 or parts[3] == 'data_block_names':
+            return None
+        if len(parts) == 7 and parts[4] == 'data' and parts[5].isdigit() and parts[6] == 'Value':
+            return {parts[3]: {int(parts[5])}}
+
+        return {parts[3]: None}
+
+    @staticmethod
+    def __merge(changes, changed):
+        """
+        add the datablocks and fields of a change to the changes of a plc
+        :return dict
+        """
+        for key, value in changed.items():
+            if key not in changes:
+                changes[key] = value
+            elif changes[key] is not None:
+                changes[key] = None if value is None else changes[key] | value
+
+        return changes
+
+    def __set(self, parts, value):
+        """
+        set a value at the path, None deletes it. The lock must be held.
+        :return:
+        """
+        if not parts:
+            self.__nodes = value if isinstance(value, dict) else {}
+            return
+
+        node = self.__nodes
+        for key in parts[:-1]:
+            child = self.__child(node, key)
+            if not isinstance(child, (dict, list)):
+                if value is None:
+                    return
+                child = {}
+                self.__put(node, key, child)
+            node = child
+
+        if value is None:
+            self.__delete(node, parts[-1])
+        else:
+            self.__put(node, parts[-1], value)
+
+    @staticmethod
+    def __child(node, key):
+        if isinstance(node, list):
+            index = int(key)
+            return node[index] if index < len(node) else None
+
+        return node.get(key)
+
+    @staticmethod
+    def __put(node, key, value):
+        if isinstance(node, list):
+            index = int(key)
+            node.extend([None] * (index + 1 - len(node)))
+            node[index] = value
+        else:
+            node[key] = value
+
+    @staticmethod
+    def __delete(node, key):
+        if isinstance(node, list):
+            index = int(key)
+            if index < len(node):
+                node[index] = None
+        else:
+            node.pop(key, None)
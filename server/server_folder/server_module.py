@@ -1,87 +1,218 @@
-from requests import get
-from requests.exceptions import ConnectionError
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+from threading import Lock, Timer
+from functools import partial
+from time import perf_counter
+import asyncio
 import logging
-from time import sleep
-from threading import Thread
 from server_folder import server_exception
-from plc_folder import plc
-from fb_folder.fb_module import Firebase
+from plc_folder import plc_exception
+from server_folder.server_scheduler import PollScheduler, DEFAULT_WORKERS
+from server_folder.server_async import AsyncRuntime
+from server_folder.server_mirror import PLCMirror
+from server_folder import server_metrics
+from server_folder.server_metrics import MetricsServer
+from server_folder.server_profiler import profiler
+from server_folder.server_shard import ShardPool, ShardedPLC
+from fb_folder.fb_key import check_key
+from fb_folder.fb_batch import UploadBatcher, DEFAULT_WINDOW, DEFAULT_MAX_SIZE
+from fb_folder.fb_queue import WriteBehindQueue, DEFAULT_JOURNAL
+
+INTERNET_CHECK_TIMEOUT = 5.0
+# order of the values of the connection state metric, released plcs are not in the holder
+CONNECTION_STATES = ('connected', 'backing off', 'open circuit', 'released')
+# plcs which are brought up at the same time and seconds after which the slow ones are logged
+BRING_UP_WORKERS = 16
+BRING_UP_TIMEOUT = 30.0
+# firebase_admin and snap7 are imported while the checks wait for the network
+HEAVY_MODULES = ('fb_folder.fb_module', 'plc_folder.plc')
 
 
 class __Server:
     __plc_holder = {}
+    # plcs which are coming up on the bring-up pool and the pending plcs whose data changed meanwhile
+    __pending = set()
+    __deferred = set()
+    __pending_lock = Lock()
+    # plcs whose operator writes were rejected during an outage, the mirror is written when they are back
+    __unwritten = set()
 
     def __init__(self):
         """
         default contructor of Server object
         :return
         """
-        pass
+        self.__timings = []
+        self.__db_link = None
 
-    def __initializing(self, fb_key_path, options=None):
+    def __prepare(self, fb_key_path, check_internet):
         """
-        initialize the __server object
-        :param fb_key_path:
+        run the internet check, the key check and the heavy imports at the same time
+        :param fb_key_path: str
+        :param check_internet: boolean
         :return:
+        :raises
+            server_exception.LostInternetConnection
+            fb_exception.SecurityKeyError
         """
-        self.__firebase = Firebase(fb_key_path, options=options)
-        self.__firebase.start_listen(self.__listener)
-        self.__continue_thread = [True]
-        self.__thread = None
+        def timed(phase, function, *args):
+            started = perf_counter()
+            result = function(*args)
+            return phase, perf_counter() - started, result
+
+        with ThreadPoolExecutor(max_workers=2 + len(HEAVY_MODULES)) as pool:
+            jobs = [pool.submit(timed, 'key check', check_key, fb_key_path)]
+            if check_internet:
+                jobs.append(pool.submit(timed, 'internet check', self.__check_internet_connection))
+            jobs.extend(pool.submit(timed, 'import ' + foo, import_module, foo) for foo in HEAVY_MODULES)
+
+            for foo in jobs:
+                phase, seconds, result = foo.result()
+                self.__timings.append((phase, seconds))
 
-        self.__check_and_start_thread()
+        # Firebase does not check the key again
+        self.__db_link = jobs[0].result()[2]
 
-    def __check_and_start_thread(self):
+    def __timed(self, phase, function, *args, **kwargs):
         """
-        start thread
+        run a startup phase and keep its time
+        :return: the result of function
+        """
+        started = perf_counter()
+        result = function(*args, **kwargs)
+        self.__timings.append((phase, perf_counter() - started))
+        return result
+
+    def __report_startup(self, started):
+        """
+        log the time of every startup phase
+        :param started: float, perf_counter time of start_server
         :return:
         """
+        self.__timings.append(('total', perf_counter() - started))
+        for phase, seconds in self.__timings:
+            server_metrics.startup_seconds.set(seconds, phase)
 
-        if isinstance(self.__thread, Thread) and self.__thread.is_alive():
-            logging.warning("thread is active")
-            return
+        logging.warning("startup: {}".format(', '.join(
+            '{} {:.3f}s'.format(phase, seconds) for phase, seconds in self.__timings)))
+        self.__timings = []
+
+    def __initializing(self, fb_key_path, options=None, poll_workers=DEFAULT_WORKERS, runtime=None,
+                       upload_window=DEFAULT_WINDOW, upload_max_size=DEFAULT_MAX_SIZE, journal_path=DEFAULT_JOURNAL,
+                       metrics_port=None, shards=1):
+        """
+        initialize the __server object
+        :param fb_key_path:
+        :param poll_workers: int
+        :param runtime: AsyncRuntime or None, if it is None polls run on a PollScheduler
+        :param upload_window: float, seconds which plc changes are collected before an upload
+        :param upload_max_size: int, paths which are uploaded at once at most
+        :param journal_path: str, file which keeps uploads while the database is not reachable
+        :param metrics_port: int or None, port of the prometheus endpoint, None does not serve it
+        :param shards: int, worker processes which hold the plcs, 1 keeps them in this process
+        :return:
+        """
+        # the shard processes are started before the threads of firebase
+        self.__shard_pool = ShardPool(shards, threads=poll_workers) if shards > 1 else None
+        # it is imported by __prepare already
+        from fb_folder.fb_module import Firebase
+
+        self.__firebase = self.__timed('firebase', Firebase, fb_key_path, options=options, db_link=self.__db_link)
+        self.__mirror = PLCMirror()
+        self.__upload_queue = WriteBehindQueue(self.__send_update, journal_path=journal_path,
+                                               max_batch=upload_max_size)
+        self.__uploader = UploadBatcher(self.__upload_queue.put, window=upload_window, max_size=upload_max_size)
+
+        if runtime is None:
+            self.__scheduler = PollScheduler(profiler.wrap('poll', self.__poll_plc), max_workers=poll_workers)
+            self.__timed('listener', self.__firebase.start_listen, profiler.wrap('listener', self.__listener))
         else:
-            try:
-                del self.__thread
-            finally:
-                self.__thread = None
+            self.__scheduler = runtime
+            self.__timed('listener', self.__firebase.start_listen, runtime.submit_event)
 
-        self.__thread = Thread(target=self.__threat_function)
-        self.__thread.start()
+        self.__bind_metrics()
+        self.__metrics_server = None if metrics_port is None else MetricsServer(server_metrics.metrics, metrics_port)
+        self.__check_and_start_scheduler()
 
-    def __threat_function(self):
+    def __bind_metrics(self):
         """
-        check plc connection in thread
+        read the counters of plcs, queues and the scheduler when the metrics are rendered
         :return:
         """
-        counter = 0
-        while True:
-            if not self.__continue_thread[0]:
-                break
-            if counter == 5:
-                counter = 0
-                self.__check_plcs_connection(True)
-                self.__upload_plc_data_to_fb()
-                sleep(1)
-            counter += 1
+        server_metrics.bytes_read.bind(lambda: {(key,): value.bytes_read for key, value in
+                                                list(self.__plc_holder.items())})
+        server_metrics.bytes_written.bind(lambda: {(key,): value.bytes_written for key, value in
+                                                   list(self.__plc_holder.items())})
+        server_metrics.connection_state.bind(lambda: {(key,): CONNECTION_STATES.index(value.connection_state)
+                                                      for key, value in list(self.__plc_holder.items())})
+        server_metrics.reconnects.bind(lambda: {(key,): value.reconnects for key, value in
+                                                list(self.__plc_holder.items())})
+        server_metrics.poll_overruns.bind(lambda: self.__scheduler.overruns)
+        server_metrics.upload_batch_depth.bind(lambda: self.__uploader.depth)
+        server_metrics.upload_queue_depth.bind(lambda: self.__upload_queue.depth)
+        server_metrics.upload_rejected.bind(lambda: self.__upload_queue.rejected)
+        server_metrics.upload_spilling.bind(lambda: int(self.__upload_queue.spilling))
+
+    def __send_update(self, payload):
+        """
+        send a multi-location map, it is the sink of the write-behind queue
+        :param payload: dict
+        :return:
+        """
+        started = perf_counter()
+        try:
+            self.__firebase.send_update(payload)
+        except Exception:
+            server_metrics.upload_errors.inc()
+            raise
 
-    def __check_plcs_connection(self, in_thread):
+        server_metrics.upload_seconds.observe(perf_counter() - started)
+        server_metrics.upload_paths.inc(amount=len(payload))
+
+    def __check_and_start_scheduler(self):
         """
-        to check if plcs are still connected
+        start scheduler
         :return:
         """
 
-        if not self.__plc_holder:
-            if not in_thread and isinstance(self.__thread, Thread) and self.__thread.is_alive():
-                self.__continue_thread[0] = False
-                self.__thread.join()
-                self.__thread = None
+        if self.__scheduler.is_active:
+            return
+
+        self.__scheduler.start()
 
+    def __poll_plc(self, plc_uid):
+        """
+        check a plc connection and upload its changes, it is run by the scheduler
+        :param plc_uid: string
+        :return:
+        """
+        try:
+            value = self.__plc_holder[plc_uid]
+        except KeyError:
             return
 
-        for key, value in list(self.__plc_holder.items()):
-            if not value.plc_connection_info:
-                self.__delete_plc(key)
+        if not value.plc_connection_info:
+            # the session is reconnected with backoff in the background, the plc and its node are kept
+            return
+
+        if plc_uid in self.__unwritten:
+            self.__unwritten.discard(plc_uid)
+            logging.warning('"{}" is back, its rejected writes are applied'.format(plc_uid))
+            self.__update_plc(plc_uid)
+
+        started = perf_counter()
+        try:
+            holder = value.data_from_plc
+        except Exception:
+            server_metrics.poll_errors.inc(plc_uid)
+            raise
+
+        server_metrics.poll_seconds.observe(perf_counter() - started, plc_uid)
+        server_metrics.fields_changed.observe(sum(len(foo[-1]) for foo in holder[1:]) if holder else 0, plc_uid)
+        if holder:
+            payload = self.__firebase.plc_data_payload(holder)
+            self.__mirror.apply_update(payload)
+            self.__uploader.add(payload)
 
     def __plc_object(self, **kwargs):
         """
@@ -92,72 +223,173 @@ class __Server:
         if not kwargs:
             return
         plc_uid = kwargs['plc_uid']
+        if plc_uid in self.__plc_holder:
+            # the plc is created again, its session must be released first
+            self.__plc_holder.pop(plc_uid).disconnect()
+
         try:
-            self.__plc_holder[plc_uid] = plc.PLC(**kwargs)
-            self.__firebase.change_new(plc_uid)
+            self.__plc_holder[plc_uid] = self.__new_plc(**kwargs)
+            # new is known from the event, it is not downloaded again. The batcher merges the
+            # maps of plcs which come up together and sends them before their first changes
+            payload = self.__firebase.new_payload(plc_uid, kwargs['new'])
+            self.__mirror.apply_update(payload)
+            self.__uploader.add(payload)
+            self.__scheduler.add(plc_uid, interval=self.__plc_holder[plc_uid].poll_interval)
+        except (plc_exception.MissingConnection, RuntimeError):
+            # an unreachable cpu or a stopped shard does not make the node wrong
+            logging.warning('"{}" could not be created, its node is kept'.format(plc_uid))
         except Exception:
             self.__firebase.delete_plc(plc_uid)
             logging.warning('"{}" was not correct and now will delete'.format(plc_uid))
 
+    def __new_plc(self, **kwargs):
+        """
+        create a plc in this process or in its shard process
+        :return: plc.PLC or ShardedPLC
+        """
+        if self.__shard_pool is None:
+            # it is imported by __prepare already
+            from plc_folder import plc
+            return plc.PLC(**kwargs)
+
+        return ShardedPLC(self.__shard_pool, **kwargs)
+
     def __create_plc(self, **database):
         """
         create plc by using firebase data
         :return:
         """
 
-        self.__check_and_start_thread()
+        self.__check_and_start_scheduler()
 
         if database is None or database == {}:
             logging.warning("Database is empty")
             return
 
-        for key, value in list(database.items()):
-            if key not in self.__plc_holder:
-                self.__plc_object(plc_uid=key, **value)
+        with self.__pending_lock:
+            entries = [(key, value) for key, value in database.items()
+                       if key not in self.__plc_holder and key not in self.__pending]
+            self.__pending.update(key for key, _ in entries)
+        if not entries:
+            return
+
+        # an unreachable plc does not stall the others, every plc is polled as soon as it is up.
+        # The listener does not wait, the events of pending plcs are deferred meanwhile
+        started = perf_counter()
+        pool = ThreadPoolExecutor(max_workers=min(BRING_UP_WORKERS, len(entries)), thread_name_prefix='bring-up')
+        jobs = {pool.submit(self.__bring_up, plc_uid=key, **value): key for key, value in entries}
+        pool.shutdown(wait=False)
+
+        lock = Lock()
+        not_done = set(jobs)
+
+        def overdue():
+            for foo in [bar for bar in jobs if not bar.done()]:
+                logging.warning('"{}" is still coming up'.format(jobs[foo]))
 
-    def __update_plc(self, plc_uid):
+        timer = Timer(BRING_UP_TIMEOUT, overdue)
+        timer.daemon = True
+        timer.start()
+
+        def finished(future):
+            with lock:
+                not_done.discard(future)
+                if not_done:
+                    return
+            timer.cancel()
+            logging.warning("bring-up of {} plcs took {:.3f}s".format(len(jobs), perf_counter() - started))
+
+        for foo in jobs:
+            foo.add_done_callback(finished)
+
+    def __bring_up(self, **kwargs):
+        """
+        create a pending plc on the bring-up pool, the changes which came meanwhile are applied after it
+        :param kwargs: dict
+        :return:
         """
-        to update existed plc object by using firebase database data
+        plc_uid = kwargs['plc_uid']
+        try:
+            self.__plc_object(**kwargs)
+        finally:
+            with self.__pending_lock:
+                self.__pending.discard(plc_uid)
+                deferred = plc_uid in self.__deferred
+                self.__deferred.discard(plc_uid)
+
+        if deferred and plc_uid in self.__plc_holder:
+            # the mirror has the latest data of the plc
+            self.__update_plc(plc_uid)
+
+    def __defer(self, plc_uid):
+        """
+        return whether a plc is coming up, then its changes are applied when it is up
         :param plc_uid: string
+        :return: boolean
+        """
+        with self.__pending_lock:
+            if plc_uid not in self.__pending:
+                return False
+            self.__deferred.add(plc_uid)
+
+        logging.warning('"{}" is still coming up, its changes are deferred'.format(plc_uid))
+        return True
+
+    def __update_plc(self, plc_uid, changed=None):
+        """
+        to update existed plc object by using the local mirror of firebase database data
+        :param plc_uid: string
+        :param changed: dict {datablock name: changed fields} or None, only these datablocks are rebuilt
         :return:
         :raise TypeError
         """
         if not isinstance(plc_uid, str):
             raise TypeError("plc_uid must be string")
 
-        data = self.__firebase.child(plc_uid).get()
+        if self.__defer(plc_uid):
+            return
+
+        data = self.__mirror.snapshot(plc_uid, changed)
+        if data is None:
+            data = self.__firebase.child(plc_uid).get()
+            self.__mirror.replace(plc_uid, data)
+            changed = None
+
+        started = perf_counter()
         try:
-            self.__plc_holder[plc_uid].update_plc(**data)
+            self.__plc_holder[plc_uid].update_plc(_changed=changed, **data)
+            server_metrics.update_seconds.observe(perf_counter() - started, plc_uid)
+        except (plc_exception.MissingConnection, plc_exception.WriteError):
+            # the mirror keeps the operator's data, it is written when the plc is polled connected again
+            self.__unwritten.add(plc_uid)
+            logging.warning('"{}" is not connected, its write is applied when it is back'.format(plc_uid))
         except KeyError:
             logging.error("something was wrong")
-            self.__plc_object(plc_uid=plc_uid, **data)
+            node = self.__mirror.snapshot(plc_uid)
+            if node is None:
+                logging.warning('"{}" is not in the database, it is not created'.format(plc_uid))
+                return
+            self.__plc_object(plc_uid=plc_uid, **node)
 
     def __delete_plc(self, key):
         """
         delete a plc object in dict and plc data on database
         :return:
         """
+        self.__scheduler.remove(key)
+        self.__unwritten.discard(key)
+
         try:
-            del self.__plc_holder[key]
+            value = self.__plc_holder.pop(key)
         except KeyError:
             return
 
+        value.disconnect()
+        server_metrics.metrics.remove(plc_uid=key)
+
         self.__firebase.delete_plc(key)
         logging.warning('"{}" is deleted.'.format(key))
 
-    def __upload_plc_data_to_fb(self):
-        """
-        to update changes of a plc to database
-        :return:
-        """
-        if not self.__plc_holder:
-            return
-
-        for value in list(self.__plc_holder.values()):
-            holder = value.data_from_plc
-            if holder:
-                self.__firebase.update_plc_data(holder)
-
     def __show_plcs(self):
         """
         show all connected plcs
@@ -169,7 +401,7 @@ class __Server:
 
         for enum, value in enumerate(self.__plc_holder.values()):
             print("{num_}: {plc_uid}: {active}".format(
-                num_=enum, plc_uid=value.plc_uid, active=value.plc_connection_info))
+                num_=enum, plc_uid=value.plc_uid, active=value.connection_state))
 
     def __stop_server(self):
         """
@@ -177,16 +409,21 @@ class __Server:
         :return:
         """
         logging.warning("server is closing")
-        self.__continue_thread[0] = False
-        self.__thread.join()
-        self.__thread = None
+        self.__scheduler.stop()
+        self.__uploader.close()
+        self.__upload_queue.close()
+        profiler.stop()
         self.__firebase.close_listen()
+        if self.__metrics_server is not None:
+            self.__metrics_server.close()
         self.__firebase = None
 
         for value in list(self.__plc_holder.values()):
             value.disconnect()
 
         self.__plc_holder = {}
+        if self.__shard_pool is not None:
+            self.__shard_pool.close()
 
     def __server_interface(self):
         """
@@ -199,6 +436,8 @@ class __Server:
         **2-show connected plcs**
         **3-show database      **
         **4-stop server        **
+        **5-show metrics       **
+        **6-start/stop profiler**
         *************************
         """
 
@@ -216,11 +455,35 @@ class __Server:
                 return True
             else:
                 print(choices)
+        elif choice == "5":
+            print(server_metrics.metrics.render())
+        elif choice == "6":
+            self.__toggle_profiler()
         else:
             print(choices)
 
         return False
 
+    @staticmethod
+    def __toggle_profiler():
+        """
+        start the profiler of polls and the listener or stop it and show its dumps
+        :return:
+        """
+        if profiler.is_active:
+            for foo in profiler.stop():
+                print(foo)
+            return
+
+        duration = input("seconds, empty profiles until it is stopped => ")
+        try:
+            duration = float(duration) if duration.strip() else None
+        except ValueError:
+            print("seconds must be a number")
+            return
+
+        profiler.start(duration=duration)
+
     def __listener(self, event):
         """
         a function which is sent start_listen method of firebase object
@@ -230,6 +493,23 @@ class __Server:
             server_exception.UnexpectedVariable
             server_exception.DatabaseWrongDataForm
         """
+        started = perf_counter()
+        try:
+            self.__handle_event(event)
+        finally:
+            server_metrics.listener_seconds.observe(perf_counter() - started, event.event_type)
+
+    def __handle_event(self, event):
+        """
+        apply a database event to the mirror and the plcs
+        :param event
+        :return:
+        :raises:
+            server_exception.UnexpectedVariable
+            server_exception.DatabaseWrongDataForm
+        """
+        changes = self.__mirror.apply(event.event_type, event.path, event.data)
+
         if event.data is None:
             # if event.data is None, the data are deleted on database
 
@@ -254,36 +534,69 @@ class __Server:
                     if not isinstance(event.data, dict):
                         raise server_exception.DatabaseWrongDataForm("data")
                     plc_uid = path[1]
-                    self.__plc_object(plc_uid=plc_uid, **event.data)
+                    if not self.__defer(plc_uid):
+                        self.__plc_object(plc_uid=plc_uid, **event.data)
 
                 elif len(path) > 2:
                     # if a size of path is greater than 2, the data on database are updated via firebase
                     plc_uid = path[1]
-                    self.__update_plc(plc_uid=plc_uid)
+                    self.__update_plc(plc_uid=plc_uid, changed=changes.get(plc_uid))
 
                 else:
                     raise server_exception.UnexpectedVariable("path")
 
             elif event.event_type.lower() == 'patch':
-                # if event_type is patch, a current data is updated
-                if event.path == '/':
-                    # if event.path is '/', the data is updated via multi-location method
-                    plc_uid = list(event.data.keys())[0].split('/')[0]
-                else:
-                    # if event.path is like '/some_path', the data is updated via single-location method
-                    plc_uid = event.path.split('/')[1]
-
-                self.__update_plc(plc_uid)
+                # if event_type is patch, a current data is updated.
+                # the mirror knows every plc which a multi-location or single-location patch changed
+                for plc_uid, changed in changes.items():
+                    self.__update_plc(plc_uid, changed=changed)
 
             else:
                 raise server_exception.UnexpectedVariable("event_type")
 
-    def start_server(self, fb_key_path, options=None):
+    async def __start_async_server(self, fb_key_path, options, poll_workers, upload_window, upload_max_size,
+                                   journal_path, check_internet, metrics_port, shards):
+        """
+        main server loop on asyncio, blocking calls run in executors
+        :return:
+        """
+        runtime = AsyncRuntime(profiler.wrap('poll', self.__poll_plc), profiler.wrap('listener', self.__listener),
+                               asyncio.get_running_loop(), max_workers=poll_workers)
+
+        started = perf_counter()
+
+        try:
+            await runtime.run_blocking(self.__prepare, fb_key_path, check_internet)
+            await runtime.run_blocking(partial(self.__initializing, fb_key_path, options=options, runtime=runtime,
+                                               upload_window=upload_window, upload_max_size=upload_max_size,
+                                               journal_path=journal_path, metrics_port=metrics_port,
+                                               shards=shards))
+            self.__report_startup(started)
+            self.__show_welcome()
+
+            while True:
+                condition = await runtime.run_blocking(self.__server_interface)
+                if condition:
+                    break
+        finally:
+            await runtime.close()
+
+    def start_server(self, fb_key_path, options=None, poll_workers=DEFAULT_WORKERS, use_asyncio=False,
+                     upload_window=DEFAULT_WINDOW, upload_max_size=DEFAULT_MAX_SIZE, journal_path=DEFAULT_JOURNAL,
+                     check_internet=True, metrics_port=None, shards=1):
         """
         main server loop
         :param:
             fb_key_path: string
             options: dict
+            poll_workers: int, the most plcs polled at the same time
+            use_asyncio: boolean, run the server on an asyncio event loop
+            upload_window: float, seconds which plc changes are collected before an upload
+            upload_max_size: int, paths which are uploaded at once at most
+            journal_path: string, file which keeps uploads while the database is not reachable
+            check_internet: boolean, False skips the internet check, for example against a local database
+            metrics_port: int or None, port of the prometheus endpoint on 127.0.0.1, None does not serve it
+            shards: int, worker processes which hold the plcs, the plcs of a cpu live in one shard
         :return:
         :raises:
             TypeError
@@ -293,9 +606,30 @@ class __Server:
         if not isinstance(options, dict) and options is not None:
             raise TypeError("options must be dict or none")
 
-        self.__check_internet_connection()
-        self.__initializing(fb_key_path, options=options)
+        if use_asyncio:
+            asyncio.run(self.__start_async_server(fb_key_path, options, poll_workers, upload_window, upload_max_size,
+                                                  journal_path, check_internet, metrics_port, shards))
+            return
+
+        started = perf_counter()
+        self.__prepare(fb_key_path, check_internet)
+        self.__initializing(fb_key_path, options=options, poll_workers=poll_workers,
+                            upload_window=upload_window, upload_max_size=upload_max_size,
+                            journal_path=journal_path, metrics_port=metrics_port, shards=shards)
+        self.__report_startup(started)
+        self.__show_welcome()
 
+        while True:
+            condition = self.__server_interface()
+            if condition:
+                break
+
+    @staticmethod
+    def __show_welcome():
+        """
+        show the welcome message
+        :return:
+        """
         print("""
         *************************
         **Welcome to the server**
@@ -303,14 +637,11 @@ class __Server:
         **2-show connected plcs**
         **3-show database      **
         **4-stop server        **
+        **5-show metrics       **
+        **6-start/stop profiler**
         *************************
         """)
 
-        while True:
-            condition = self.__server_interface()
-            if condition:
-                break
-
     @staticmethod
     def __check_internet_connection():
         """
@@ -318,9 +649,12 @@ class __Server:
         :return:
         :raise server_exception.LostInternetConnection
         """
+        from requests import get
+        from requests.exceptions import ConnectionError, Timeout
+
         try:
-            get("https://www.google.com")
-        except ConnectionError:
+            get("https://www.google.com", timeout=INTERNET_CHECK_TIMEOUT)
+        except (ConnectionError, Timeout):
             raise server_exception.LostInternetConnection("")
 
 
@@ -0,0 +1,175 @@
+from threading import Lock, Timer
+from functools import wraps
+from datetime import datetime
+from io import StringIO
+import cProfile
+import pstats
+import tracemalloc
+import logging
+import os
+
+DEFAULT_DIRECTORY = "profiles"
+TRACE_FRAMES = 25
+TOP_LINES = 50
+
+
+class Profiler:
+    """
+    Profiles the wrapped functions, for example a poll and the listener, while it is started.
+    Every call is profiled on its own thread with cProfile and the calls of a scope are merged
+    into one pstats file. tracemalloc snapshots of the whole process are compared at the end.
+    A function which is wrapped costs one attribute check while the profiler is stopped.
+    """
+
+    def __init__(self):
+        """
+        Profiler constructor
+        """
+        self.__active = False
+        self.__stats = {}
+        self.__lock = Lock()
+        self.__directory = DEFAULT_DIRECTORY
+        self.__memory = None
+        self.__own_tracemalloc = False
+        self.__timer = None
+        self.__started = None
+
+    def wrap(self, scope, function):
+        """
+        return a function which is profiled under scope while the profiler is started
+        :param scope: str, the name of the pstats file
+        :param function: function
+        :return: function
+        """
+
+        @wraps(function)
+        def profiled(*args, **kwargs):
+            if not self.__active:
+                return function(*args, **kwargs)
+
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # another profiler is active on this thread
+                return function(*args, **kwargs)
+
+            try:
+                return function(*args, **kwargs)
+            finally:
+                profile.disable()
+                self.__add(scope, profile)
+
+        return profiled
+
+    def start(self, duration=None, directory=DEFAULT_DIRECTORY, memory=True):
+        """
+        start profiling
+        :param duration: float or None, seconds after which the profiler stops itself
+        :param directory: str, the dumps are written there
+        :param memory: boolean, take tracemalloc snapshots
+        :return:
+        :raise RuntimeError
+        """
+        with self.__lock:
+            if self.__active:
+                raise RuntimeError("profiler is already started")
+
+            self.__stats = {}
+            self.__directory = directory
+            self.__started = datetime.now()
+
+            if memory:
+                self.__own_tracemalloc = not tracemalloc.is_tracing()
+                if self.__own_tracemalloc:
+                    tracemalloc.start(TRACE_FRAMES)
+                self.__memory = tracemalloc.take_snapshot()
+
+            if duration:
+                self.__timer = Timer(duration, self.__stop_by_timer)
+                self.__timer.daemon = True
+                self.__timer.start()
+
+            self.__active = True
+            logging.warning("profiler is started")
+
+    def stop(self):
+        """
+        stop profiling and write the dumps
+        :return: list contains str, the written files
+        """
+        with self.__lock:
+            if not self.__active:
+                return []
+
+            self.__active = False
+            if self.__timer is not None:
+                self.__timer.cancel()
+                self.__timer = None
+            stats, self.__stats = self.__stats, {}
+            memory, self.__memory = self.__memory, None
+
+        return self.__dump(stats, memory)
+
+    def __stop_by_timer(self):
+        files = self.stop()
+        logging.warning("profiler is stopped, dumps: {}".format(', '.join(files)))
+
+    def __add(self, scope, profile):
+        """
+        merge the profile of a call into its scope
+        :return:
+        """
+        with self.__lock:
+            if not self.__active:
+                return
+            if scope in self.__stats:
+                self.__stats[scope].add(profile)
+            else:
+                self.__stats[scope] = pstats.Stats(profile)
+
+    def __dump(self, stats, memory):
+        """
+        write pstats files, their readable summaries and the memory comparison
+        :return: list contains str
+        """
+        os.makedirs(self.__directory, exist_ok=True)
+        stamp = self.__started.strftime('%Y%m%d-%H%M%S')
+        files = []
+
+        for scope, value in stats.items():
+            path = os.path.join(self.__directory, '{}_{}.pstats'.format(scope, stamp))
+            value.dump_stats(path)
+            files.append(path)
+
+            text = StringIO()
+            value.stream = text
+            value.sort_stats('cumulative').print_stats(TOP_LINES)
+            with open(path[:-len('.pstats')] + '.txt', 'w') as output:
+                output.write(text.getvalue())
+
+        if memory is not None:
+            snapshot = tracemalloc.take_snapshot()
+            if self.__own_tracemalloc:
+                tracemalloc.stop()
+
+            path = os.path.join(self.__directory, 'memory_{}.tracemalloc'.format(stamp))
+            snapshot.dump(path)
+            files.append(path)
+
+            with open(path[:-len('.tracemalloc')] + '.txt', 'w') as output:
+                for foo in snapshot.compare_to(memory, 'lineno')[:TOP_LINES]:
+                    output.write('{}\n'.format(foo))
+
+        return files
+
+    @property
+    def is_active(self):
+        """
+        return whether the profiler is started
+        :return: Boolean
+        """
+        return self.__active
+
+
+profiler = Profiler()
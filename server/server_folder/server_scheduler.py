@@ -0,0 +1,174 @@
+from concurrent.futures import ThreadPoolExecutor
+from threading import Condition, Thread
+from itertools import count
+from time import monotonic
+import heapq
+import logging
+
+DEFAULT_INTERVAL = 1.0
+DEFAULT_WORKERS = 8
+
+
+class PollScheduler:
+    """Polls every registered key on its own interval over a bounded worker pool"""
+
+    def __init__(self, job, max_workers=DEFAULT_WORKERS):
+        """
+        PollScheduler constructor
+        :param job: function which takes a key and polls it
+        :param max_workers: int, the most polls running at the same time
+        :raise ValueError
+        """
+        if max_workers < 1:
+            raise ValueError("max_workers must be positive")
+
+        self.__job = job
+        self.__max_workers = max_workers
+        self.__heap = []
+        self.__entries = {}
+        self.__intervals = {}
+        self.__running = set()
+        self.__overruns = {}
+        self.__sequence = count()
+        self.__condition = Condition()
+        self.__pool = None
+        self.__thread = None
+        self.__active = False
+
+    def add(self, key, interval=DEFAULT_INTERVAL):
+        """
+        add a key or change its interval, it is polled immediately
+        :param key: hashable
+        :param interval: float, seconds
+        :return:
+        :raise ValueError
+        """
+        if interval <= 0:
+            raise ValueError("interval must be positive")
+
+        with self.__condition:
+            self.__intervals[key] = interval
+            self.__overruns.setdefault(key, 0)
+            if key not in self.__running:
+                self.__push(key, monotonic())
+
+    def remove(self, key):
+        """
+        remove a key, a running poll of the key is not interrupted
+        :param key: hashable
+        :return:
+        """
+        with self.__condition:
+            self.__intervals.pop(key, None)
+            self.__entries.pop(key, None)
+            self.__overruns.pop(key, None)
+
+    def start(self):
+        """
+        start the dispatcher thread
+        :return:
+        """
+        with self.__condition:
+            if self.__active:
+                logging.warning("scheduler is active")
+                return
+
+            self.__active = True
+            self.__pool = ThreadPoolExecutor(max_workers=self.__max_workers)
+            self.__thread = Thread(target=self.__dispatch, name="poll-scheduler", daemon=True)
+            self.__thread.start()
+
+    def stop(self):
+        """
+        stop the dispatcher and wait for the running polls
+        :return:
+        """
+        with self.__condition:
+            if not self.__active:
+                return
+            self.__active = False
+            self.__condition.notify_all()
+
+        self.__thread.join()
+        self.__pool.shutdown(wait=True)
+        self.__thread = None
+        self.__pool = None
+
+    def __push(self, key, due):
+        """
+        push a key to the heap, an older entry of the key becomes stale
+        :return:
+        """
+        sequence = next(self.__sequence)
+        self.__entries[key] = sequence
+        heapq.heappush(self.__heap, (due, sequence, key))
+        self.__condition.notify()
+
+    def __dispatch(self):
+        """
+        wait for the next due key and hand it to the pool
+        :return:
+        """
+        with self.__condition:
+            while self.__active:
+                if not self.__heap or len(self.__running) >= self.__max_workers:
+                    self.__condition.wait()
+                    continue
+
+                due, sequence, key = self.__heap[0]
+                if self.__entries.get(key) != sequence:
+                    heapq.heappop(self.__heap)
+                    continue
+
+                delay = due - monotonic()
+                if delay > 0:
+                    self.__condition.wait(delay)
+                    continue
+
+                heapq.heappop(self.__heap)
+                del self.__entries[key]
+                self.__running.add(key)
+                self.__pool.submit(self.__run, key, due)
+
+    def __run(self, key, due):
+        """
+        poll a key and schedule its next poll
+        :return:
+        """
+        started = monotonic()
+        try:
+            self.__job(key)
+        except Exception:
+            logging.exception('poll of "{}" failed'.format(key))
+        finally:
+            finished = monotonic()
+
+            with self.__condition:
+                self.__running.discard(key)
+                interval = self.__intervals.get(key)
+
+                if interval is not None:
+                    if finished - started > interval:
+                        self.__overruns[key] += 1
+                        logging.warning('poll of "{}" took {:.3f}s, interval is {:.3f}s'.format(
+                            key, finished - started, interval))
+                    self.__push(key, max(due + interval, finished))
+
+                self.__condition.notify()
+
+    @property
+    def overruns(self):
+        """
+        return how many times a poll took longer than its interval
+        :return: dict
+        """
+        with self.__condition:
+            return dict(self.__overruns)
+
+    @property
+    def is_active(self):
+        """
+        return whether the dispatcher runs
+        :return: Boolean
+        """
+        return self.__active
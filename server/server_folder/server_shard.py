@@ -0,0 +1,296 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from multiprocessing import get_context
+from threading import Lock, Thread
+from itertools import count
+from zlib import crc32
+from pickle import dumps, loads
+import logging
+
+DEFAULT_THREADS = 8
+STATIC_PROPERTIES = ('plc_uid', 'plc_parameters', 'poll_interval')
+
+
+def shard_of(plc_parameters, shards):
+    """
+    return the shard of a plc, it does not change between runs. The shard is chosen by the cpu
+    and not by plc_uid, so the plc entries of a cpu share one session in one process.
+    :param plc_parameters: dict, it has Ip_Address, Rack and Slot
+    :param shards: int
+    :return: int
+    :raise KeyError
+    """
+    cpu = '{}/{}/{}'.format(plc_parameters['Ip_Address'], plc_parameters['Rack'], plc_parameters['Slot'])
+    return crc32(cpu.encode()) % shards
+
+
+def _portable(error):
+    """
+    return an exception which can be sent to the coordinator
+    """
+    try:
+        return loads(dumps(error))
+    except Exception:
+        return RuntimeError(repr(error))
+
+
+def _worker(connection, threads):
+    """
+    main function of a shard process, it holds the plc objects of its shard.
+    A request is (request_id, plc_uid, action, name, args, kwargs), the answer is (request_id, error, result).
+    :param connection: multiprocessing connection
+    :param threads: int, requests which run at the same time
+    :return:
+    """
+    from plc_folder import plc
+
+    plcs = {}
+    send_lock = Lock()
+    pool = ThreadPoolExecutor(max_workers=threads)
+
+    def answer(request_id, error, result):
+        with send_lock:
+            connection.send((request_id, error, result))
+
+    def run(request_id, plc_uid, action, name, args, kwargs):
+        try:
+            if action == 'create':
+                if plc_uid in plcs:
+                    plcs.pop(plc_uid).disconnect()
+                value = plc.PLC(**kwargs)
+                plcs[plc_uid] = value
+                result = {foo: getattr(value, foo) for foo in STATIC_PROPERTIES}
+            elif action == 'delete':
+                value = plcs.pop(plc_uid, None)
+                if value is not None:
+                    value.disconnect()
+                result = None
+            elif name.startswith('_'):
+                raise AttributeError(name)
+            elif action == 'get':
+                result = getattr(plcs[plc_uid], name)
+            else:
+                result = getattr(plcs[plc_uid], name)(*args, **kwargs)
+        except Exception as Error:
+            answer(request_id, _portable(Error), None)
+        else:
+            answer(request_id, None, result)
+
+    try:
+        while True:
+            try:
+                request = connection.recv()
+            except EOFError:
+                break
+            if request is None:
+                break
+            pool.submit(run, *request)
+    finally:
+        pool.shutdown(wait=True)
+        for foo in plcs.values():
+            foo.disconnect()
+        connection.close()
+
+
+class _Shard:
+    """Coordinator side of a shard process"""
+
+    def __init__(self, context, index, threads):
+        self.index = index
+        self.connection, child = context.Pipe()
+        self.process = context.Process(target=_worker, args=(child, threads), name="shard-{}".format(index),
+                                       daemon=True)
+        self.process.start()
+        child.close()
+        self.pending = {}
+        self.lock = Lock()
+        self.requests = count()
+        self.receiver = Thread(target=self.__receive, name="shard-{}-receiver".format(index), daemon=True)
+        self.receiver.start()
+
+    def request(self, plc_uid, action, name=None, args=(), kwargs=None):
+        """
+        send a request and return its future
+        :return: Future
+        """
+        future = Future()
+
+        with self.lock:
+            request_id = next(self.requests)
+            self.pending[request_id] = future
+            try:
+                self.connection.send((request_id, plc_uid, action, name, args, kwargs or {}))
+            except (OSError, ValueError) as Error:
+                del self.pending[request_id]
+                raise RuntimeError("shard {} is stopped: {}".format(self.index, Error))
+
+        return future
+
+    def __receive(self):
+        """
+        resolve the futures of the answers
+        :return:
+        """
+        while True:
+            try:
+                request_id, error, result = self.connection.recv()
+            except (EOFError, OSError):
+                break
+
+            with self.lock:
+                future = self.pending.pop(request_id, None)
+            if future is None:
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        for foo in pending.values():
+            foo.set_exception(RuntimeError("shard {} is stopped".format(self.index)))
+
+    def close(self, timeout):
+        try:
+            with self.lock:
+                self.connection.send(None)
+        except (OSError, ValueError):
+            pass
+
+        self.process.join(timeout)
+        if self.process.is_alive():
+            logging.warning("shard {} did not stop and is terminated".format(self.index))
+            self.process.terminate()
+        self.connection.close()
+
+
+class ShardPool:
+    """
+    Worker processes which hold the plcs. A plc lives in the shard of its cpu, see shard_of,
+    so reading and decoding of different shards run on different cores.
+    """
+
+    def __init__(self, shards, threads=DEFAULT_THREADS):
+        """
+        ShardPool constructor
+        :param shards: int, worker processes
+        :param threads: int, requests which a worker runs at the same time
+        :raise ValueError
+        """
+        if shards < 1 or threads < 1:
+            raise ValueError("shards and threads must be positive")
+
+        # a forked child would inherit the locks of the listener and the upload threads
+        context = get_context('spawn')
+        self.__shards = [_Shard(context, foo, threads) for foo in range(shards)]
+
+    def shard_for(self, plc_parameters):
+        """
+        return the shard index of a plc
+        :param plc_parameters: dict
+        :return: int
+        """
+        return shard_of(plc_parameters, len(self.__shards))
+
+    def request(self, shard, plc_uid, action, name=None, args=(), kwargs=None):
+        """
+        run an action on the shard of a plc and wait for its result
+        :param shard: int, see shard_for
+        :param plc_uid: str
+        :param action: str, create, delete, get or call
+        :param name: str, the property or the method of the plc
+        :param args: tuple, the arguments of the method
+        :param kwargs: dict, the keyword arguments of the method or of plc.PLC
+        :return: the result
+        :raise the exception of the plc
+        """
+        return self.__shards[shard].request(plc_uid, action, name, args, kwargs).result()
+
+    def close(self, timeout=10.0):
+        """
+        stop the worker processes, their plcs are disconnected
+        :return:
+        """
+        for foo in self.__shards:
+            foo.close(timeout)
+
+    def __len__(self):
+        return len(self.__shards)
+
+
+class ShardedPLC:
+    """A plc which lives in a shard process, it has the interface of plc.PLC which the server uses"""
+
+    def __init__(self, pool, **kwargs):
+        """
+        ShardedPLC constructor, the plc is created in its shard
+        :param pool: ShardPool
+        :param kwargs: the arguments of plc.PLC
+        :raise the exceptions of plc.PLC
+        """
+        self.__pool = pool
+        self.__uid = kwargs['plc_uid']
+        self.__shard = pool.shard_for(kwargs['plc_parameters'])
+        self.__static = pool.request(self.__shard, self.__uid, 'create', kwargs=kwargs)
+
+    def update_plc(self, _changed=None, **kwargs):
+        return self.__pool.request(self.__shard, self.__uid, 'call', 'update_plc',
+                                   kwargs=dict(kwargs, _changed=_changed))
+
+    def upload_new_data(self, **kwargs):
+        return self.__pool.request(self.__shard, self.__uid, 'call', 'upload_new_data', kwargs=kwargs)
+
+    def disconnect(self):
+        try:
+            self.__pool.request(self.__shard, self.__uid, 'delete')
+        except RuntimeError as Error:
+            logging.warning("{} was not disconnected: {}".format(self.__uid, Error))
+
+    def __get(self, name):
+        return self.__pool.request(self.__shard, self.__uid, 'get', name)
+
+    @property
+    def data_from_plc(self):
+        return self.__get('data_from_plc')
+
+    @property
+    def plc_connection_info(self):
+        try:
+            return self.__get('plc_connection_info')
+        except (KeyError, RuntimeError):
+            return False
+
+    @property
+    def connection_state(self):
+        try:
+            return self.__get('connection_state')
+        except (KeyError, RuntimeError):
+            return 'released'
+
+    @property
+    def bytes_read(self):
+        return self.__get('bytes_read')
+
+    @property
+    def bytes_written(self):
+        return self.__get('bytes_written')
+
+    @property
+    def reconnects(self):
+        return self.__get('reconnects')
+
+    @property
+    def plc_parameters(self):
+        return self.__static['plc_parameters']
+
+    @property
+    def poll_interval(self):
+        return self.__static['poll_interval']
+
+    @property
+    def plc_name(self):
+        return self.__get('plc_name')
+
+    @property
+    def plc_uid(self):
+        return self.__static['plc_uid']
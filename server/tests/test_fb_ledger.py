@@ -0,0 +1,41 @@
+from fb_folder.fb_ledger import WriteLedger
+
+VALUE = 'plc/current/datablocks/DB1/data/0/Value'
+
+
+def upload(ledger, value):
+    """
+    record an upload of the server and return its echo, a multi-location patch on /
+    """
+    payload = {VALUE: value, 'plc/changer_id': 'server'}
+    ledger.record(payload)
+    return payload
+
+
+def test_echo_with_changer_id_consumes_its_writes():
+    ledger = WriteLedger()
+
+    first = upload(ledger, True)
+    second = upload(ledger, False)
+    assert ledger.changer_id('/', first, patch=True) == 'server'
+    assert ledger.changer_id('/', second, patch=True) == 'server'
+
+    # the operator sets a value which the server uploaded before, it is not an echo
+    assert ledger.changer_id('/' + VALUE, True, patch=False) is None
+    assert len(ledger) == 0
+
+
+def test_put_echo_is_consumed_once():
+    ledger = WriteLedger()
+
+    ledger.record({VALUE: 1.5})
+    assert ledger.changer_id('/' + VALUE, 1.5, patch=False) == 'server'
+    assert ledger.changer_id('/' + VALUE, 1.5, patch=False) is None
+
+
+def test_operator_changer_id_keeps_the_writes():
+    ledger = WriteLedger()
+
+    ledger.record({VALUE: 1})
+    assert ledger.changer_id('/', {VALUE: 1, 'plc/changer_id': 'other'}, patch=True) == 'other'
+    assert ledger.changer_id('/' + VALUE, 1, patch=False) == 'server'
@@ -0,0 +1,45 @@
+from time import sleep, monotonic
+from fb_folder.fb_queue import WriteBehindQueue, DEAD_LETTER_SUFFIX
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = monotonic() + timeout
+    while not condition():
+        assert monotonic() < deadline, "timed out"
+        sleep(0.01)
+
+
+def sent_paths(sent):
+    return {key for foo in sent for key in foo}
+
+
+def test_torn_tail_is_cut_before_a_later_append(tmp_path):
+    journal = tmp_path / "journal.jsonl"
+    journal.write_bytes(b'{"a/b": 1}\n{"a/c": ')
+    sent = []
+
+    queue = WriteBehindQueue(sent.append, journal_path=str(journal))
+    queue.put({'x/y': 2})
+    wait_for(lambda: sent_paths(sent) == {'a/b', 'x/y'})
+    queue.close()
+
+    assert queue.rejected == 1
+    assert '{\\"a/c\\": ' in (tmp_path / ("journal.jsonl" + DEAD_LETTER_SUFFIX)).read_text()
+
+
+def test_torn_line_inside_the_journal_is_skipped(tmp_path):
+    journal = tmp_path / "journal.jsonl"
+    # a crash tore the second map and a later run appended the third one to it
+    journal.write_bytes(b'{"a/b": 1}\n{"a/c": {"d/e": 3}\n{"f/g": 4}\n')
+    sent = []
+
+    queue = WriteBehindQueue(sent.append, journal_path=str(journal))
+    wait_for(lambda: sent_paths(sent) == {'a/b', 'f/g'})
+
+    # the thread is still alive
+    queue.put({'x/y': 2})
+    wait_for(lambda: 'x/y' in sent_paths(sent))
+    queue.close()
+
+    assert queue.rejected == 1
+    assert not queue.spilling
@@ -0,0 +1,42 @@
+from time import sleep
+from snap7.util import get_real, set_real
+from plc_folder.plc_models import Datablock, Version_Model
+
+
+def field(value, **kwargs):
+    return dict({'Data_type': 'Real', 'Offset': 0, 'Value': value}, **kwargs)
+
+
+def image(value):
+    holder = bytearray(4)
+    set_real(holder, 0, value)
+    return holder
+
+
+def version(value, previous=None, **kwargs):
+    datablocks = {'data_block_names': ['DB1'], 'DB1': {'size': 4, 'data': [field(value, **kwargs)]}}
+    return Version_Model(_name='current', plc_informations={}, datablocks=datablocks, previous=previous)
+
+
+def test_held_change_is_published_when_the_plc_stops_changing():
+    datablock = Datablock(_name='DB1', size=4, data=[field(1.0, Min_Interval=0.2)])
+
+    assert datablock.create_data_for_fb(image(2.0))[1] == {0: 2.0}
+    assert datablock.create_data_for_fb(image(3.0))[1] == {}
+    assert datablock.has_held
+
+    sleep(0.25)
+    assert datablock.create_data_for_fb(image(3.0))[1] == {0: 3.0}
+    assert not datablock.has_held
+
+
+def test_full_rebuild_keeps_the_plc_value_in_the_deadband():
+    old_data = version(1.0, Deadband=1.0).snapshot('old_data')
+    # 1.5 is in the deadband, the database keeps 1.0
+    assert old_data.datablocks[0].create_data_for_fb(image(1.5))[1] == {}
+
+    current = version(1.0, previous=old_data, Deadband=1.0)
+    assert get_real(bytearray(current.datablocks[0].datablock), 0) == 1.5
+
+    current = version(7.0, previous=old_data, Deadband=1.0)
+    assert get_real(bytearray(current.datablocks[0].datablock), 0) == 7.0